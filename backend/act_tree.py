@@ -0,0 +1,97 @@
+from sqlalchemy import insert, select, literal, true
+from sqlalchemy.orm import Session, aliased
+from models import Act, ActClosure
+
+
+def add_to_closure(db: Session, act_id: int, parent_id=None):
+    """Добавить новое занятие в таблицу замыкания (до commit)"""
+    db.execute(insert(ActClosure).values(ancestor_id=act_id, descendant_id=act_id, depth=0))
+    if parent_id is not None:
+        db.execute(insert(ActClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(ActClosure.ancestor_id, literal(act_id), ActClosure.depth + 1).where(
+                ActClosure.descendant_id == parent_id
+            )
+        ))
+
+
+def is_descendant(db: Session, act_id: int, ancestor_id: int):
+    return db.query(ActClosure).filter(
+        ActClosure.ancestor_id == ancestor_id,
+        ActClosure.descendant_id == act_id
+    ).first() is not None
+
+
+def move_in_closure(db: Session, act_id: int, new_parent_id=None):
+    """Перенести поддерево act_id под new_parent_id (до commit).
+
+    Удаляются связи поддерева с прежними предками и добавляется
+    декартово произведение новых предков на узлы поддерева.
+    Проверка на циклы - на вызывающей стороне (is_descendant).
+    """
+    subtree = select(ActClosure.descendant_id).where(ActClosure.ancestor_id == act_id)
+    old_ancestors = select(ActClosure.ancestor_id).where(
+        ActClosure.descendant_id == act_id,
+        ActClosure.ancestor_id != act_id
+    )
+    db.query(ActClosure).filter(
+        ActClosure.descendant_id.in_(subtree),
+        ActClosure.ancestor_id.in_(old_ancestors)
+    ).delete(synchronize_session=False)
+
+    if new_parent_id is not None:
+        above = aliased(ActClosure)
+        below = aliased(ActClosure)
+        db.execute(insert(ActClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(above.ancestor_id, below.descendant_id, above.depth + below.depth + 1)
+            .select_from(above)
+            .join(below, true())  # декартово произведение задумано
+            .where(
+                above.descendant_id == new_parent_id,
+                below.ancestor_id == act_id
+            )
+        ))
+
+
+def act_to_dict(act):
+    return {
+        "id": act.id,
+        "title": act.title,
+        "start_date": act.start_date,
+        "end_date": act.end_date,
+        "hidden": act.hidden,
+        "sort_order": act.sort_order,
+        "parent_id": act.parent_id,
+    }
+
+
+def load_tree(db: Session, root_id=None):
+    """Дерево занятий одним запросом.
+
+    Без root_id возвращается весь лес, иначе поддерево root_id
+    (выборка через таблицу замыкания). Дети упорядочены по sort_order, id.
+    """
+    query = db.query(Act)
+    if root_id is not None:
+        query = query.join(ActClosure, ActClosure.descendant_id == Act.id).filter(
+            ActClosure.ancestor_id == root_id
+        )
+    acts = query.order_by(Act.sort_order, Act.id).all()
+
+    nodes = {act.id: {**act_to_dict(act), "children": []} for act in acts}
+    roots = []
+    for act in acts:
+        node = nodes[act.id]
+        if act.id != root_id and act.parent_id in nodes:
+            nodes[act.parent_id]["children"].append(node)
+        else:
+            roots.append(node)
+    return roots
+
+
+def descendant_ids(db: Session, act_id: int, include_self=True):
+    query = db.query(ActClosure.descendant_id).filter(ActClosure.ancestor_id == act_id)
+    if not include_self:
+        query = query.filter(ActClosure.depth > 0)
+    return [descendant_id for (descendant_id,) in query.order_by(ActClosure.depth, ActClosure.descendant_id)]
@@ -24,6 +24,14 @@ if config.config_file_name is not None:
 #target_metadata = None
 target_metadata = Base.metadata
 
+# Объекты полнотекстового поиска создаются миграцией вручную и в моделях
+# не описаны: FTS5-таблицы на SQLite, GIN-индекс на PostgreSQL
+SEARCH_OBJECTS = ("questions_fts", "ix_questions_search")
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (reflected and name.startswith(SEARCH_OBJECTS))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -48,6 +56,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -69,7 +78,8 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,31 @@
+"""add_insert_sentinels
+
+Revision ID: 3e8a6c2f9b15
+Revises: 9c3e5b7a1d24
+Create Date: 2026-10-18 20:31:12.604518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8a6c2f9b15'
+down_revision: Union[str, Sequence[str], None] = '9c3e5b7a1d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Столбцы-сентинелы для пакетного INSERT ... RETURNING (models.Act._sentinel)
+    op.add_column('acts', sa.Column('_sentinel', sa.Integer(), nullable=True))
+    op.add_column('questions', sa.Column('_sentinel', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('questions', '_sentinel')
+    op.drop_column('acts', '_sentinel')
@@ -0,0 +1,32 @@
+"""add_question_source_key
+
+Revision ID: 4b1d7e0a9f3c
+Revises: c96ef29cc0c2
+Create Date: 2026-10-18 13:02:17.480215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b1d7e0a9f3c'
+down_revision: Union[str, Sequence[str], None] = 'c96ef29cc0c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('questions', sa.Column('source_key', sa.String(), nullable=True))
+    op.add_column('questions', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_questions_source_key'), 'questions', ['source_key'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_questions_source_key'), table_name='questions')
+    op.drop_column('questions', 'content_hash')
+    op.drop_column('questions', 'source_key')
@@ -99,6 +99,8 @@ def downgrade() -> None:
     op.drop_table('times')
     op.drop_index(op.f('ix_timers_id'), table_name='timers')
     op.drop_table('timers')
+    # На PostgreSQL Enum - отдельный тип, drop_table его не удаляет
+    sa.Enum(name='timerstate').drop(op.get_bind(), checkfirst=True)
     op.drop_index(op.f('ix_tasks_sort_order'), table_name='tasks')
     op.drop_index(op.f('ix_tasks_id'), table_name='tasks')
     op.drop_table('tasks')
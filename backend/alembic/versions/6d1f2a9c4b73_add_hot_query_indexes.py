@@ -0,0 +1,61 @@
+"""add_hot_query_indexes
+
+Revision ID: 6d1f2a9c4b73
+Revises: b58d2f4e7c61
+Create Date: 2026-10-18 17:05:12.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d1f2a9c4b73'
+down_revision: Union[str, Sequence[str], None] = 'b58d2f4e7c61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Перед уникальным индексом убираем повторы (session_id, question_id),
+    # оставляя самую раннюю строку. Счётчики затронутых сессий удаляются -
+    # get_session_stats пересчитает их при первом обращении.
+    op.execute("""
+        DELETE FROM session_stats WHERE session_id IN (
+            SELECT session_id FROM session_questions
+            GROUP BY session_id, question_id HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM session_questions WHERE id NOT IN (
+            SELECT MIN(id) FROM session_questions GROUP BY session_id, question_id
+        )
+    """)
+    op.create_index('ix_session_questions_session_id_question_id', 'session_questions', ['session_id', 'question_id'], unique=True)
+    op.create_index('ix_session_questions_session_id_status', 'session_questions', ['session_id', 'status'], unique=False)
+    op.create_index(op.f('ix_session_questions_question_id'), 'session_questions', ['question_id'], unique=False)
+    op.create_index('ix_question_tags_tag_slug_question_id', 'question_tags', ['tag_slug', 'question_id'], unique=False)
+    op.create_index('ix_times_act_id_day', 'times', ['act_id', 'day'], unique=False)
+    op.create_index(op.f('ix_acts_parent_id'), 'acts', ['parent_id'], unique=False)
+    op.create_index(op.f('ix_tasks_plan_id'), 'tasks', ['plan_id'], unique=False)
+    op.create_index(op.f('ix_tasks_act_id'), 'tasks', ['act_id'], unique=False)
+    op.create_index(op.f('ix_act_notes_act_id'), 'act_notes', ['act_id'], unique=False)
+    op.create_index(op.f('ix_plan_notes_plan_id'), 'plan_notes', ['plan_id'], unique=False)
+    op.create_index(op.f('ix_timers_act_id'), 'timers', ['act_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_timers_act_id'), table_name='timers')
+    op.drop_index(op.f('ix_plan_notes_plan_id'), table_name='plan_notes')
+    op.drop_index(op.f('ix_act_notes_act_id'), table_name='act_notes')
+    op.drop_index(op.f('ix_tasks_act_id'), table_name='tasks')
+    op.drop_index(op.f('ix_tasks_plan_id'), table_name='tasks')
+    op.drop_index(op.f('ix_acts_parent_id'), table_name='acts')
+    op.drop_index('ix_times_act_id_day', table_name='times')
+    op.drop_index('ix_question_tags_tag_slug_question_id', table_name='question_tags')
+    op.drop_index(op.f('ix_session_questions_question_id'), table_name='session_questions')
+    op.drop_index('ix_session_questions_session_id_status', table_name='session_questions')
+    op.drop_index('ix_session_questions_session_id_question_id', table_name='session_questions')
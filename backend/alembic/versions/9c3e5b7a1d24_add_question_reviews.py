@@ -0,0 +1,40 @@
+"""add_question_reviews
+
+Revision ID: 9c3e5b7a1d24
+Revises: 6d1f2a9c4b73
+Create Date: 2026-10-18 17:48:03.901227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e5b7a1d24'
+down_revision: Union[str, Sequence[str], None] = '6d1f2a9c4b73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('question_reviews',
+    sa.Column('question_id', sa.Integer(), nullable=False),
+    sa.Column('ease', sa.Float(), nullable=False),
+    sa.Column('interval', sa.Float(), nullable=False),
+    sa.Column('repetitions', sa.Integer(), nullable=False),
+    sa.Column('lapses', sa.Integer(), nullable=False),
+    sa.Column('next_due', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('last_reviewed', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['question_id'], ['questions.id'], ),
+    sa.PrimaryKeyConstraint('question_id')
+    )
+    op.create_index(op.f('ix_question_reviews_next_due'), 'question_reviews', ['next_due'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_question_reviews_next_due'), table_name='question_reviews')
+    op.drop_table('question_reviews')
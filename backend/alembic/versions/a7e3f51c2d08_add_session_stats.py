@@ -0,0 +1,38 @@
+"""add_session_stats
+
+Revision ID: a7e3f51c2d08
+Revises: 4b1d7e0a9f3c
+Create Date: 2026-10-18 13:41:05.902311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7e3f51c2d08'
+down_revision: Union[str, Sequence[str], None] = '4b1d7e0a9f3c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('session_stats',
+    sa.Column('session_id', sa.Integer(), nullable=False),
+    sa.Column('total_questions', sa.Integer(), nullable=False),
+    sa.Column('easy_questions', sa.Integer(), nullable=False),
+    sa.Column('medium_questions', sa.Integer(), nullable=False),
+    sa.Column('hard_questions', sa.Integer(), nullable=False),
+    sa.Column('pending_questions', sa.Integer(), nullable=False),
+    sa.Column('total_shows', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['session_id'], ['study_sessions.id'], ),
+    sa.PrimaryKeyConstraint('session_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('session_stats')
@@ -0,0 +1,36 @@
+"""add_table_versions
+
+Revision ID: b58d2f4e7c61
+Revises: f0a9c3e71b42
+Create Date: 2026-10-18 16:12:40.275119
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b58d2f4e7c61'
+down_revision: Union[str, Sequence[str], None] = 'f0a9c3e71b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    table_versions = op.create_table('table_versions',
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_versions, [
+        {'table_name': name, 'version': 0}
+        for name in ('acts', 'act_closure', 'questions', 'question_tags', 'tags')
+    ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('table_versions')
@@ -0,0 +1,71 @@
+"""add_questions_fts
+
+Revision ID: c96ef29cc0c2
+Revises: 5376da082312
+Create Date: 2026-10-18 12:10:42.113508
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c96ef29cc0c2'
+down_revision: Union[str, Sequence[str], None] = '5376da082312'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_context().dialect.name == 'postgresql':
+        # На PostgreSQL - GIN-индекс по выражению, вопрос весит больше ответа.
+        # Выражение должно совпадать с search.POSTGRES_DOCUMENT
+        op.execute("""
+            CREATE INDEX ix_questions_search ON questions USING gin ((
+                setweight(to_tsvector('simple', q), 'A') || setweight(to_tsvector('simple', a), 'B')
+            ))
+        """)
+        return
+
+    # Внешний контент: индекс хранит только токены, тексты берутся из questions.
+    # Токенизатор unicode61 разбивает и приводит к нижнему регистру и кириллицу.
+    op.execute("""
+        CREATE VIRTUAL TABLE questions_fts USING fts5(
+            q, a,
+            content='questions',
+            content_rowid='id',
+            tokenize='unicode61'
+        )
+    """)
+    op.execute("""
+        CREATE TRIGGER questions_fts_ai AFTER INSERT ON questions BEGIN
+            INSERT INTO questions_fts(rowid, q, a) VALUES (new.id, new.q, new.a);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER questions_fts_ad AFTER DELETE ON questions BEGIN
+            INSERT INTO questions_fts(questions_fts, rowid, q, a) VALUES ('delete', old.id, old.q, old.a);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER questions_fts_au AFTER UPDATE OF q, a ON questions BEGIN
+            INSERT INTO questions_fts(questions_fts, rowid, q, a) VALUES ('delete', old.id, old.q, old.a);
+            INSERT INTO questions_fts(rowid, q, a) VALUES (new.id, new.q, new.a);
+        END
+    """)
+    # Индексируем уже существующие вопросы
+    op.execute("INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_questions_search")
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS questions_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS questions_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS questions_fts_ai")
+    op.execute("DROP TABLE IF EXISTS questions_fts")
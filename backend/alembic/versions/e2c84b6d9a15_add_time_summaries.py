@@ -0,0 +1,63 @@
+"""add_time_summaries
+
+Revision ID: e2c84b6d9a15
+Revises: a7e3f51c2d08
+Create Date: 2026-10-18 14:26:51.337940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c84b6d9a15'
+down_revision: Union[str, Sequence[str], None] = 'a7e3f51c2d08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('times_weekly',
+    sa.Column('week_start', sa.Date(), nullable=False),
+    sa.Column('act_id', sa.Integer(), nullable=False),
+    sa.Column('time', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['act_id'], ['acts.id'], ),
+    sa.PrimaryKeyConstraint('week_start', 'act_id')
+    )
+    op.create_table('times_monthly',
+    sa.Column('month_start', sa.Date(), nullable=False),
+    sa.Column('act_id', sa.Integer(), nullable=False),
+    sa.Column('time', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['act_id'], ['acts.id'], ),
+    sa.PrimaryKeyConstraint('month_start', 'act_id')
+    )
+    # Заполняем сводки по уже накопленным данным
+    if op.get_context().dialect.name == 'postgresql':
+        week_start = "date_trunc('week', day)::date"
+        month_start = "date_trunc('month', day)::date"
+    else:
+        week_start = "date(day, 'weekday 0', '-6 days')"
+        month_start = "date(day, 'start of month')"
+    op.execute(f"""
+        INSERT INTO times_weekly (week_start, act_id, time, count)
+        SELECT {week_start}, act_id, SUM(COALESCE(time, 0)), SUM(COALESCE(count, 0))
+        FROM times
+        GROUP BY {week_start}, act_id
+    """)
+    op.execute(f"""
+        INSERT INTO times_monthly (month_start, act_id, time, count)
+        SELECT {month_start}, act_id, SUM(COALESCE(time, 0)), SUM(COALESCE(count, 0))
+        FROM times
+        GROUP BY {month_start}, act_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('times_monthly')
+    op.drop_table('times_weekly')
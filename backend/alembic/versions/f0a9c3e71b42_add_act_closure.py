@@ -0,0 +1,48 @@
+"""add_act_closure
+
+Revision ID: f0a9c3e71b42
+Revises: e2c84b6d9a15
+Create Date: 2026-10-18 15:08:33.614027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f0a9c3e71b42'
+down_revision: Union[str, Sequence[str], None] = 'e2c84b6d9a15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('act_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['acts.id'], ),
+    sa.ForeignKeyConstraint(['descendant_id'], ['acts.id'], ),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index(op.f('ix_act_closure_descendant_id'), 'act_closure', ['descendant_id'], unique=False)
+    # Строим замыкание по существующим parent_id
+    op.execute("""
+        INSERT INTO act_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM acts
+            UNION ALL
+            SELECT tree.ancestor_id, acts.id, tree.depth + 1
+            FROM acts JOIN tree ON acts.parent_id = tree.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM tree
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_act_closure_descendant_id'), table_name='act_closure')
+    op.drop_table('act_closure')
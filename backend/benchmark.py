@@ -0,0 +1,753 @@
+"""Замер задержек эндпоинтов на синтетической базе большого объёма.
+
+Скрипт создаёт одноразовую SQLite-базу (миграции alembic), заполняет её
+данными заданного масштаба и прогоняет маршруты main.py внутри процесса
+через ASGI-транспорт httpx. Для каждого сценария печатаются p50/p95/p99
+и число SQL-запросов на запрос. С --baseline результаты сравниваются с
+сохранённым прогоном, и при регрессии скрипт завершается с кодом 1.
+С --explain каждый выполненный запрос проверяется через EXPLAIN QUERY
+PLAN: полный просмотр таблицы (кроме ALLOWED_FULL_SCANS) тоже ошибка.
+В конце пачка из GROUP_COMMIT_JOBS заданий очереди записи (writer.py)
+должна уложиться в одну транзакцию с одним COMMIT, а счётчики каждой
+сессии (session_stats) - совпасть с пересчётом, иначе тоже ошибка.
+Ошибка и запрос сценария с признаком N+1 (см. metrics.py), и пакетный
+сценарий, выполнивший больше запросов, чем QUERY_BUDGETS.
+
+    python benchmark.py --scale 0.1
+    python benchmark.py --save-baseline bench_baseline.json
+    python benchmark.py --baseline bench_baseline.json --only questions
+    python benchmark.py --scale 0.01 --requests 2 --warmup 0 --explain
+
+Нужен httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORDS = (
+    "python sql индекс запрос транзакция кэш очередь поток процесс память "
+    "алгоритм сортировка дерево граф хэш список словарь генератор итератор "
+    "декоратор класс функция модуль пакет тест профилирование блокировка "
+    "сервер клиент протокол сокет json http асинхронность событие"
+).split()
+DIFFICULTIES = ("easy", "medium", "hard")
+STATUSES = ("pending", "easy", "medium", "hard")
+CHUNK = 10000
+# Нижние границы объёмов при малом --scale: сценарии выбирают несколько тэгов сразу
+MIN_COUNTS = {"tags": 5}
+
+
+def chunked(rows, size=CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def text_of(rnd, words):
+    return " ".join(rnd.choice(WORDS) for _ in range(words))
+
+
+# --- Наполнение базы ---
+
+def seed(engine, args, rnd):
+    """Заполнить пустую базу и вернуть контекст для сценариев (id, связи)"""
+    from sqlalchemy import insert
+    from models import (
+        Act, ActClosure, Question, QuestionReview, SessionQuestion, SessionStats, StudySession, Tag, TestItem,
+        Time, TimeMonthly, TimeWeekly, question_tags,
+    )
+    from study import STATUS_COUNTERS
+    from time_reports import month_start, week_start
+
+    ctx = {"rnd": rnd}
+    with engine.begin() as conn:
+        def insert_all(model, rows):
+            for chunk in chunked(rows):
+                conn.execute(insert(model), chunk)
+
+        tag_slugs = [f"tag-{i}" for i in range(args.tags)]
+        insert_all(Tag, ({"slug": slug, "title": slug.title()} for slug in tag_slugs))
+        ctx["tags"] = tag_slugs
+
+        insert_all(Question, (
+            {"id": i, "q": text_of(rnd, 12), "a": text_of(rnd, 60), "difficulty": rnd.choice(DIFFICULTIES)}
+            for i in range(1, args.questions + 1)
+        ))
+        insert_all(question_tags, (
+            {"question_id": i, "tag_slug": slug}
+            for i in range(1, args.questions + 1)
+            for slug in rnd.sample(tag_slugs, min(len(tag_slugs), rnd.randint(1, 3)))
+        ))
+        ctx["questions"] = args.questions
+
+        # Иерархия занятий по уровням: родитель - случайное занятие предыдущего уровня
+        levels, parents, ancestors = [[] for _ in range(args.act_depth)], {}, {}
+        for act_id in range(1, args.acts + 1):
+            level = (act_id - 1) * args.act_depth // args.acts
+            parent_id = rnd.choice(levels[level - 1]) if level else None
+            levels[level].append(act_id)
+            parents[act_id] = parent_id
+            ancestors[act_id] = (ancestors[parent_id] if parent_id else []) + [act_id]
+        insert_all(Act, (
+            {"id": act_id, "title": f"Занятие {act_id}", "parent_id": parent_id, "hidden": False, "sort_order": act_id}
+            for act_id, parent_id in parents.items()
+        ))
+        insert_all(ActClosure, (
+            {"ancestor_id": ancestor_id, "descendant_id": act_id, "depth": len(chain) - 1 - depth}
+            for act_id, chain in ancestors.items()
+            for depth, ancestor_id in enumerate(chain)
+        ))
+        ctx["act_parents"] = parents
+        ctx["root_acts"] = levels[0]
+
+        days = max(1, -(-args.times // max(1, args.acts)))
+        first_day = date.today() - timedelta(days=days - 1)
+        weekly, monthly = {}, {}
+
+        def times():
+            for n in range(args.times):
+                day = first_day + timedelta(days=n // args.acts)
+                act_id = n % args.acts + 1
+                seconds, count = rnd.randint(60, 3600), rnd.randint(0, 5)
+                for summary, start in ((weekly, week_start(day)), (monthly, month_start(day))):
+                    total = summary.setdefault((start, act_id), [0, 0])
+                    total[0] += seconds
+                    total[1] += count
+                yield {"day": day, "act_id": act_id, "time": seconds, "count": count}
+
+        insert_all(Time, times())
+        insert_all(TimeWeekly, (
+            {"week_start": start, "act_id": act_id, "time": total[0], "count": total[1]}
+            for (start, act_id), total in weekly.items()
+        ))
+        insert_all(TimeMonthly, (
+            {"month_start": start, "act_id": act_id, "time": total[0], "count": total[1]}
+            for (start, act_id), total in monthly.items()
+        ))
+        ctx["first_day"], ctx["last_day"] = first_day, first_day + timedelta(days=days - 1)
+
+        per_session = min(args.questions, args.session_questions // max(1, args.sessions))
+        ctx["session_questions"] = {}
+        for session_id in range(1, args.sessions + 1):
+            conn.execute(insert(StudySession), {"id": session_id, "name": f"Сессия {session_id}"})
+            question_ids = rnd.sample(range(1, args.questions + 1), per_session)
+            rows = [
+                {"session_id": session_id, "question_id": question_id,
+                 "times_shown": rnd.randint(1, 5), "status": rnd.choice(STATUSES)}
+                for question_id in question_ids
+            ]
+            insert_all(SessionQuestion, rows)
+            ctx["session_questions"][session_id] = question_ids
+            if session_id == args.sessions:
+                # Последняя сессия - без строки счётчиков, как сессии до их появления
+                ctx["session_without_stats"] = session_id
+                continue
+            stats = {counter: 0 for counter in STATUS_COUNTERS.values()}
+            for row in rows:
+                stats[STATUS_COUNTERS[row["status"]]] += 1
+            conn.execute(insert(SessionStats), {
+                "session_id": session_id, "total_questions": len(rows),
+                "total_shows": sum(row["times_shown"] for row in rows), **stats,
+            })
+
+        # Расписание повторений для всех вопросов, которые уже встречались в сессиях
+        now = datetime.now()
+        reviewed = sorted({question_id for ids in ctx["session_questions"].values() for question_id in ids})
+        insert_all(QuestionReview, (
+            {"question_id": question_id, "ease": round(rnd.uniform(1.3, 3.0), 2), "interval": rnd.randint(1, 60),
+             "repetitions": rnd.randint(1, 8), "lapses": rnd.randint(0, 3),
+             "next_due": now + timedelta(days=rnd.uniform(-30, 30)), "last_reviewed": now}
+            for question_id in reviewed
+        ))
+
+        insert_all(TestItem, (
+            {"id": i, "name": f"item {i}", "description": text_of(rnd, 8)}
+            for i in range(1, args.test_items + 1)
+        ))
+        ctx["test_items"] = args.test_items
+    return ctx
+
+
+# --- Сценарии ---
+# Каждый сценарий - (имя, маршрут, фабрика). Фабрика получает клиент и
+# номер итерации, может подготовить данные (это время не замеряется) и
+# возвращает (метод, url, аргументы запроса).
+
+def scenarios(ctx):
+    rnd = ctx["rnd"]
+    parents = ctx["act_parents"]
+
+    def question_id():
+        return rnd.randint(1, ctx["questions"])
+
+    def act_id():
+        return rnd.randint(1, len(parents))
+
+    def act_body(act):
+        return {"title": f"Занятие {act}", "parent_id": parents[act], "sort_order": act}
+
+    def session_id():
+        return rnd.randint(1, len(ctx["session_questions"]))
+
+    def question_body(i):
+        return {"q": f"bench {i} " + text_of(rnd, 10), "a": text_of(rnd, 40), "difficulty": "easy",
+                "tag_slugs": rnd.sample(ctx["tags"], 2)}
+
+    def day():
+        return ctx["first_day"] + timedelta(days=rnd.randint(0, (ctx["last_day"] - ctx["first_day"]).days))
+
+    def fixed(method, url, **kwargs):
+        async def make(client, i):
+            return method, url, kwargs
+        return make
+
+    async def new_act(client, i):
+        return (await client.post("/acts/", json={"title": f"bench {i}", "parent_id": act_id()})).json()["id"]
+
+    async def new_question(client, i):
+        return (await client.post("/api/v1/questions/", json=question_body(i))).json()["id"]
+
+    async def new_tag(client, i):
+        slug = f"bench-del-{i}"
+        await client.post("/api/v1/tags/", json={"slug": slug, "title": slug})
+        return slug
+
+    async def new_session(client, i):
+        return (await client.post("/api/v1/study-sessions/", json={"name": f"bench {i}"})).json()["id"]
+
+    async def new_timer(client, i):
+        return (await client.post("/api/v1/timers/", json={"act_id": act_id()})).json()["id"]
+
+    async def update_act(client, i):
+        act = act_id()
+        return "PUT", f"/acts/{act}", {"json": act_body(act)}
+
+    async def get_timer(client, i):
+        return "GET", f"/api/v1/timers/{await new_timer(client, i)}", {}
+
+    async def rate(client, i):
+        session = session_id()
+        question = rnd.choice(ctx["session_questions"][session])
+        return "POST", f"/api/v1/study-sessions/{session}/rate-question", {
+            "json": {"session_id": session, "question_id": question, "rating": rnd.choice(STATUSES[1:])}
+        }
+
+    async def rate_batch(client, i):
+        # Пачка крупнее порога N+1 (metrics.py) со смесью оценок: разные
+        # оценки меняют разные поля, и запросов не должно стать больше
+        session = session_id()
+        questions = rnd.sample(ctx["session_questions"][session], min(30, len(ctx["session_questions"][session])))
+        return "POST", f"/api/v1/study-sessions/{session}/ratings", {
+            "json": [{"question_id": question, "rating": rnd.choice(STATUSES[1:])} for question in questions]
+        }
+
+    async def shows_batch(client, i):
+        session = session_id()
+        questions = rnd.sample(ctx["session_questions"][session], min(10, len(ctx["session_questions"][session])))
+        return "POST", f"/api/v1/study-sessions/{session}/shows", {"json": questions}
+
+    async def delete_act(client, i):
+        return "DELETE", "/acts/batch", {"json": [await new_act(client, i)]}
+
+    async def delete_question(client, i):
+        return "DELETE", f"/api/v1/questions/{await new_question(client, i)}", {}
+
+    async def delete_questions(client, i):
+        return "DELETE", "/api/v1/questions/batch", {"json": [await new_question(client, i)]}
+
+    async def delete_tag(client, i):
+        return "DELETE", f"/api/v1/tags/{await new_tag(client, i)}", {}
+
+    async def delete_tags(client, i):
+        return "DELETE", "/api/v1/tags/batch", {"json": [await new_tag(client, i)]}
+
+    async def delete_session(client, i):
+        return "DELETE", f"/api/v1/study-sessions/{await new_session(client, i)}", {}
+
+    async def end_session(client, i):
+        return "POST", f"/api/v1/study-sessions/{await new_session(client, i)}/end", {}
+
+    async def stop_timer(client, i):
+        return "POST", f"/api/v1/timers/{await new_timer(client, i)}/stop", {}
+
+    def dynamic(method, url_fn, body_fn=None, params_fn=None):
+        async def make(client, i):
+            kwargs = {}
+            if body_fn:
+                kwargs["json"] = body_fn(i)
+            if params_fn:
+                kwargs["params"] = params_fn(i)
+            return method, url_fn(i), kwargs
+        return make
+
+    return [
+        ("root", "GET /", fixed("GET", "/")),
+        ("db-test", "GET /db-test/", fixed("GET", "/db-test/")),
+        ("id echo", "GET /{id:str}/", fixed("GET", "/bench/")),
+        ("activity echo", "GET /activities/{slug:str}/", fixed("GET", "/activities/bench/")),
+
+        ("acts list", "GET /acts/", fixed("GET", "/acts/")),
+        ("acts tree", "GET /acts/tree", fixed("GET", "/acts/tree")),
+        ("acts subtree", "GET /acts/tree", dynamic("GET", lambda i: "/acts/tree",
+                                                    params_fn=lambda i: {"root_id": rnd.choice(ctx["root_acts"])})),
+        ("act", "GET /acts/{act_id}", dynamic("GET", lambda i: f"/acts/{act_id()}")),
+        ("act descendants", "GET /acts/{act_id}/descendants",
+         dynamic("GET", lambda i: f"/acts/{rnd.choice(ctx['root_acts'])}/descendants")),
+        ("act create", "POST /acts/", dynamic("POST", lambda i: "/acts/",
+                                               body_fn=lambda i: {"title": f"bench {i}", "parent_id": act_id()})),
+        ("act update", "PUT /acts/{act_id}", update_act),
+        ("acts batch create", "POST /acts/batch", dynamic("POST", lambda i: "/acts/batch", body_fn=lambda i: [
+            {"title": f"bench {i}.{n}", "parent_id": act_id()} for n in range(10)
+        ])),
+        ("acts batch update", "PUT /acts/batch", dynamic("PUT", lambda i: "/acts/batch", body_fn=lambda i: [
+            {"id": act, **act_body(act)} for act in (act_id() for _ in range(10))
+        ])),
+        ("acts batch delete", "DELETE /acts/batch", delete_act),
+
+        ("time add", "POST /api/v1/times/", dynamic("POST", lambda i: "/api/v1/times/", body_fn=lambda i: {
+            "day": day().isoformat(), "act_id": act_id(), "time": 60, "count": 1
+        })),
+        ("time set", "PUT /api/v1/times/{day}/{act_id}",
+         dynamic("PUT", lambda i: f"/api/v1/times/{day().isoformat()}/{act_id()}", body_fn=lambda i: {"time": 600})),
+        ("time report by week", "GET /api/v1/times/report", dynamic("GET", lambda i: "/api/v1/times/report", params_fn=lambda i: {
+            "start": ctx["first_day"].isoformat(), "end": ctx["last_day"].isoformat(), "period": "week",
+            "act_id": rnd.choice(ctx["root_acts"]),
+        })),
+        ("time report by day", "GET /api/v1/times/report", dynamic("GET", lambda i: "/api/v1/times/report", params_fn=lambda i: {
+            "start": (ctx["last_day"] - timedelta(days=30)).isoformat(), "end": ctx["last_day"].isoformat(),
+        })),
+
+        ("timers list", "GET /api/v1/timers/", fixed("GET", "/api/v1/timers/")),
+        ("timer start", "POST /api/v1/timers/", dynamic("POST", lambda i: "/api/v1/timers/",
+                                                        body_fn=lambda i: {"act_id": act_id()})),
+        ("timer", "GET /api/v1/timers/{timer_id}", get_timer),
+        ("timer stop", "POST /api/v1/timers/{timer_id}/{action}", stop_timer),
+
+        ("tags list", "GET /api/v1/tags/", fixed("GET", "/api/v1/tags/")),
+        ("tag", "GET /api/v1/tags/{tag_slug}", dynamic("GET", lambda i: f"/api/v1/tags/{rnd.choice(ctx['tags'])}")),
+        ("tag create", "POST /api/v1/tags/", dynamic("POST", lambda i: "/api/v1/tags/",
+                                                     body_fn=lambda i: {"slug": f"bench-{i}", "title": "bench"})),
+        ("tag delete", "DELETE /api/v1/tags/{tag_slug}", delete_tag),
+        ("tags batch create", "POST /api/v1/tags/batch", dynamic("POST", lambda i: "/api/v1/tags/batch", body_fn=lambda i: [
+            {"slug": f"bench-batch-{i}-{n}", "title": "bench"} for n in range(10)
+        ])),
+        ("tags batch update", "PUT /api/v1/tags/batch", dynamic("PUT", lambda i: "/api/v1/tags/batch", body_fn=lambda i: [
+            {"slug": slug, "title": f"{slug} {i}"} for slug in rnd.sample(ctx["tags"], 3)
+        ])),
+        ("tags batch delete", "DELETE /api/v1/tags/batch", delete_tags),
+
+        ("questions page", "GET /api/v1/questions/", dynamic("GET", lambda i: "/api/v1/questions/", params_fn=lambda i: {
+            "after_id": rnd.randint(0, ctx["questions"]), "limit": 100
+        })),
+        ("questions page, no answers", "GET /api/v1/questions/", dynamic("GET", lambda i: "/api/v1/questions/", params_fn=lambda i: {
+            "after_id": rnd.randint(0, ctx["questions"]), "limit": 100, "fields": "id,q,difficulty,tags"
+        })),
+        ("questions by tag", "GET /api/v1/questions/", dynamic("GET", lambda i: "/api/v1/questions/", params_fn=lambda i: {
+            "tag": rnd.choice(ctx["tags"]), "after_id": rnd.randint(0, ctx["questions"] // 2), "limit": 100
+        })),
+        ("questions excluding tag", "GET /api/v1/questions/", dynamic("GET", lambda i: "/api/v1/questions/", params_fn=lambda i: {
+            "exclude_tag": rnd.choice(ctx["tags"]), "difficulty": rnd.choice(DIFFICULTIES),
+            "after_id": rnd.randint(0, ctx["questions"] // 2), "limit": 100
+        })),
+        ("questions search", "GET /api/v1/questions/search", dynamic("GET", lambda i: "/api/v1/questions/search",
+                                                                      params_fn=lambda i: {"q": " ".join(rnd.sample(WORDS, 2))})),
+        ("question facets", "GET /api/v1/questions/facets", dynamic("GET", lambda i: "/api/v1/questions/facets",
+                                                                    params_fn=lambda i: {"difficulty": rnd.choice(DIFFICULTIES)})),
+        ("question", "GET /api/v1/questions/{question_id}",
+         dynamic("GET", lambda i: f"/api/v1/questions/{question_id()}")),
+        ("question answer", "GET /api/v1/questions/{question_id}/answer",
+         dynamic("GET", lambda i: f"/api/v1/questions/{question_id()}/answer")),
+        ("question create", "POST /api/v1/questions/", dynamic("POST", lambda i: "/api/v1/questions/", body_fn=question_body)),
+        ("question update", "PUT /api/v1/questions/{question_id}",
+         dynamic("PUT", lambda i: f"/api/v1/questions/{question_id()}", body_fn=question_body)),
+        ("question delete", "DELETE /api/v1/questions/{id}", delete_question),
+        ("questions batch create", "POST /api/v1/questions/batch", dynamic("POST", lambda i: "/api/v1/questions/batch",
+                                                                          body_fn=lambda i: [question_body(i) for _ in range(10)])),
+        ("questions batch update", "PUT /api/v1/questions/batch", dynamic("PUT", lambda i: "/api/v1/questions/batch", body_fn=lambda i: [
+            {"id": question_id(), **question_body(i)} for _ in range(10)
+        ])),
+        ("questions batch delete", "DELETE /api/v1/questions/batch", delete_questions),
+        ("cache stats", "GET /api/v1/cache/stats", fixed("GET", "/api/v1/cache/stats")),
+        ("writer stats", "GET /api/v1/writer/stats", fixed("GET", "/api/v1/writer/stats")),
+        ("metrics", "GET /metrics", fixed("GET", "/metrics")),
+
+        ("test items", "GET /test-items/", fixed("GET", "/test-items/")),
+        ("test item", "GET /test-items/{item_id}",
+         dynamic("GET", lambda i: f"/test-items/{rnd.randint(1, ctx['test_items'])}")),
+        ("test item create", "POST /test-items/", dynamic("POST", lambda i: "/test-items/",
+                                                          body_fn=lambda i: {"name": f"bench {i}", "description": "bench"})),
+        ("db inspect tags", "GET /db/inspect", fixed("GET", "/db/inspect", params={"table": "tags"})),
+
+        ("sessions list", "GET /api/v1/study-sessions/", fixed("GET", "/api/v1/study-sessions/")),
+        ("session", "GET /api/v1/study-sessions/{session_id}",
+         dynamic("GET", lambda i: f"/api/v1/study-sessions/{session_id()}")),
+        ("session create", "POST /api/v1/study-sessions/", dynamic("POST", lambda i: "/api/v1/study-sessions/",
+                                                                   body_fn=lambda i: {"name": f"bench {i}"})),
+        ("session delete", "DELETE /api/v1/study-sessions/{session_id}", delete_session),
+        ("session end", "POST /api/v1/study-sessions/{session_id}/end", end_session),
+        ("next question", "GET /api/v1/study-sessions/{session_id}/next-question",
+         dynamic("GET", lambda i: f"/api/v1/study-sessions/{session_id()}/next-question")),
+        ("next questions", "GET /api/v1/study-sessions/{session_id}/next-questions",
+         dynamic("GET", lambda i: f"/api/v1/study-sessions/{session_id()}/next-questions?n=10")),
+        ("shows batch", "POST /api/v1/study-sessions/{session_id}/shows", shows_batch),
+        ("rate question", "POST /api/v1/study-sessions/{session_id}/rate-question", rate),
+        ("ratings batch", "POST /api/v1/study-sessions/{session_id}/ratings", rate_batch),
+        ("due reviews", "GET /api/v1/reviews/due", fixed("GET", "/api/v1/reviews/due")),
+        ("session statistics", "GET /api/v1/study-sessions/{session_id}/statistics",
+         dynamic("GET", lambda i: f"/api/v1/study-sessions/{session_id()}/statistics")),
+    ]
+
+
+# Маршруты, которые не замеряются: бесконечный поток событий
+SKIPPED_ROUTES = {"GET /api/v1/events"}
+
+
+# --- Замер ---
+
+class QueryCounter:
+    """SQL-запросы, выполненные движками БД с последнего reset()"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.statements = {}  # текст запроса -> параметры первого выполнения
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        with self.lock:
+            self.count += 1
+            self.statements.setdefault(statement, parameters[0] if executemany else parameters)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+async def run(app, counter, cases, args):
+    import httpx
+
+    results, statements = {}, {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, route, factory in cases:
+            latencies, queries, scenario_statements = [], [], {}
+            for i in range(args.warmup + args.requests):
+                method, url, kwargs = await factory(client, f"{name}-{i}")
+                counter.reset()
+                started = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                elapsed = time.perf_counter() - started
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{name}: {method} {url} -> {response.status_code} {response.text[:200]}")
+                if i >= args.warmup:
+                    latencies.append(elapsed * 1000)
+                    queries.append(counter.count)
+                    scenario_statements.update(counter.statements)
+            statements[name] = scenario_statements
+            results[name] = {
+                "route": route,
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "queries": statistics.median(queries),
+                "max_queries": max(queries),
+            }
+            print(format_row(name, results[name]), flush=True)
+    return results, statements
+
+
+# Пакетные сценарии, у которых число запросов не зависит от размера и
+# состава пачки: больше запросов - ошибка, даже без сохранённого прогона
+QUERY_BUDGETS = {
+    "questions batch create": 5,
+    "acts batch create": 6,
+    "shows batch": 8,
+    "ratings batch": 10,
+}
+
+
+# Сценарии, которым полный просмотр таблицы разрешён: они отдают таблицу целиком
+ALLOWED_FULL_SCANS = {
+    "acts list": {"acts"},
+    "acts tree": {"acts"},
+    "tags list": {"tags"},
+    "test items": {"test_items"},
+    "sessions list": {"study_sessions"},
+    "db inspect tags": {"tags"},
+    "question facets": {"tags", "question_tags", "questions"},
+}
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$")
+
+
+def full_scans(conn, statement, parameters):
+    """Таблицы, которые запрос читает целиком, по EXPLAIN QUERY PLAN"""
+    verb = statement.lstrip().upper()
+    # INSERT ... VALUES таблицы не читает, а его текст и параметры в событии
+    # могут не совпадать из-за пакетной вставки (insertmanyvalues)
+    if verb.startswith("INSERT") and " SELECT " not in verb:
+        return set()
+    if not verb.startswith(("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")):
+        return set()
+    plan = conn.connection.cursor().execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    return {
+        match.group(1) for *_, detail in plan
+        if (match := FULL_SCAN.match(detail)) and not match.group(1).startswith("sqlite_")
+    }
+
+
+def check_plans(engine, statements):
+    """Запросы сценариев, которые неожиданно читают таблицу целиком"""
+    problems = []
+    with engine.connect() as conn:
+        for name, scenario_statements in statements.items():
+            allowed = ALLOWED_FULL_SCANS.get(name, set())
+            for statement, parameters in scenario_statements.items():
+                tables = full_scans(conn, statement, parameters) - allowed
+                if tables:
+                    problems.append((name, tables, " ".join(statement.split())))
+    return problems
+
+
+GROUP_COMMIT_JOBS = 20
+
+
+def check_group_commit(engine, session_factory, jobs=GROUP_COMMIT_JOBS):
+    """Сколько транзакций и COMMIT уходит на одну пачку заданий WriteQueue.
+
+    Команды считаются по trace callback соединения SQLite, то есть так,
+    как их выполнила сама SQLite: неявные транзакции pysqlite событий
+    SQLAlchemy не порождают. Транзакция - команда, начатая вне транзакции.
+    """
+    from sqlalchemy import event, insert
+    from models import Tag
+    from writer import WriteJob, WriteQueue
+
+    counts = {"transactions": 0, "commits": 0}
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        def trace(statement):
+            if not dbapi_connection.in_transaction:
+                counts["transactions"] += 1
+            if statement.strip().upper() == "COMMIT":
+                counts["commits"] += 1
+        dbapi_connection.set_trace_callback(trace)
+
+    def on_checkin(dbapi_connection, connection_record):
+        if dbapi_connection is not None:
+            dbapi_connection.set_trace_callback(None)
+
+    def add_tag(number):
+        return lambda db: db.execute(insert(Tag).values(slug=f"group-commit-{number}", title="group commit"))
+
+    batch = [WriteJob(add_tag(number)) for number in range(jobs)]
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+    try:
+        WriteQueue(session_factory)._write(batch)
+    finally:
+        event.remove(engine, "checkout", on_checkout)
+        event.remove(engine, "checkin", on_checkin)
+    failed = sum(1 for job in batch if job.error is not None)
+    return counts["transactions"], counts["commits"], failed
+
+
+def check_session_stats(session_factory, session_id):
+    """Сессии, у которых счётчики session_stats расходятся с пересчётом.
+
+    Сначала оценивает вопрос в session_id - сессии без строки счётчиков -
+    так же, как POST .../ratings: строка должна появиться уже с учётом оценки.
+    """
+    from types import SimpleNamespace
+    from sqlalchemy import select
+    import bulk
+    from models import SessionQuestion, SessionStats
+    from study import compute_session_stats, get_session_stats, stats_to_dict
+
+    with session_factory() as db:
+        if db.get(SessionStats, session_id) is None:
+            question_id = db.execute(select(SessionQuestion.question_id).where(
+                SessionQuestion.session_id == session_id, SessionQuestion.status != "hard"
+            ).limit(1)).scalar()
+            if question_id is not None:
+                bulk.rate_questions(db, session_id, [SimpleNamespace(question_id=question_id, rating="hard")])
+                get_session_stats(db, session_id)
+                db.commit()
+        return [
+            row.session_id for row in db.query(SessionStats)
+            if stats_to_dict(row) != compute_session_stats(db, row.session_id)
+        ]
+
+
+def format_row(name, row, status=""):
+    return (f"{name:<28} {row['p50']:>9.2f} {row['p95']:>9.2f} {row['p99']:>9.2f} "
+            f"{row['queries']:>6g} {row['max_queries']:>6} {status}")
+
+
+def compare(results, baseline, tolerance, noise_ms):
+    """Сценарии, где p95 вырос больше допуска или стало больше запросов"""
+    regressions = []
+    for name, row in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        reasons = []
+        if row["p95"] > base["p95"] * (1 + tolerance) and row["p95"] - base["p95"] > noise_ms:
+            reasons.append(f"p95 {base['p95']:.2f} -> {row['p95']:.2f} ms")
+        if row["max_queries"] > base["max_queries"]:
+            reasons.append(f"queries {base['max_queries']} -> {row['max_queries']}")
+        if reasons:
+            regressions.append((name, reasons))
+    return regressions
+
+
+def uncovered_routes(app, cases):
+    from fastapi.routing import APIRoute
+
+    covered = {route for _, route, _ in cases} | SKIPPED_ROUTES
+    return sorted(
+        f"{method} {route.path}"
+        for route in app.routes if isinstance(route, APIRoute)
+        for method in route.methods
+        if f"{method} {route.path}" not in covered
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", help="путь к файлу базы (по умолчанию - временный)")
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель для всех объёмов данных")
+    parser.add_argument("--questions", type=int, default=100_000)
+    parser.add_argument("--tags", type=int, default=200)
+    parser.add_argument("--acts", type=int, default=5_000)
+    parser.add_argument("--act-depth", type=int, default=12, help="число уровней иерархии занятий")
+    parser.add_argument("--times", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--session-questions", type=int, default=50_000, help="всего строк session_questions")
+    parser.add_argument("--test-items", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=30, help="замеряемых запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", action="append", default=[], help="только сценарии, в имени которых есть подстрока")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--save-baseline", help="сохранить результаты в JSON")
+    parser.add_argument("--explain", action="store_true",
+                        help="проверить EXPLAIN QUERY PLAN всех запросов сценариев на полный просмотр таблиц")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост p95 (доля)")
+    parser.add_argument("--noise-ms", type=float, default=1.0, help="рост p95 меньше этого не считается регрессией")
+    args = parser.parse_args()
+    for name in ("questions", "tags", "acts", "times", "sessions", "session_questions", "test_items"):
+        setattr(args, name, max(MIN_COUNTS.get(name, 1), int(getattr(args, name) * args.scale)))
+    args.act_depth = max(1, min(args.act_depth, args.acts))
+    return args
+
+
+def main():
+    args = parse_args()
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    if os.path.exists(db_path):
+        sys.exit(f"{db_path} already exists, the benchmark needs an empty database")
+    # Настройки БД читаются при импорте database, поэтому модули приложения
+    # импортируются только после того, как задан DATABASE_URL
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, BACKEND_DIR)
+
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import event
+
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    command.upgrade(config, "head")
+
+    import database
+    import main as app_module
+
+    started = time.perf_counter()
+    ctx = seed(database.engine, args, random.Random(args.seed))
+    print(f"Seeded {db_path} in {time.perf_counter() - started:.1f} s: "
+          f"{args.questions} questions, {args.acts} acts, {args.times} times, "
+          f"{args.session_questions} session questions", flush=True)
+
+    counter = QueryCounter()
+    for engine in {database.engine, database.read_engine}:
+        event.listen(engine, "before_cursor_execute", counter)
+
+    cases = scenarios(ctx)
+    if args.only:
+        cases = [case for case in cases if any(part in case[0] for part in args.only)]
+    else:
+        for route in uncovered_routes(app_module.app, cases):
+            print(f"warning: no scenario for {route}")
+
+    print(f"{'scenario':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'q/req':>6} {'max q':>6}")
+    results, statements = asyncio.run(run(app_module.app, counter, cases, args))
+
+    exit_code = 0
+    from metrics import metrics
+    for (method, route), count in sorted(metrics.n_plus_one.items()):
+        print(f"N+1 {method} {route}: {count} request(s)")
+        exit_code = 1
+    for name, budget in QUERY_BUDGETS.items():
+        if name in results and results[name]["max_queries"] > budget:
+            print(f"QUERY BUDGET {name}: {results[name]['max_queries']} queries, budget {budget}")
+            exit_code = 1
+    if args.explain:
+        problems = check_plans(database.engine, statements)
+        for name, tables, statement in problems:
+            print(f"FULL SCAN {name}: {', '.join(sorted(tables))}: {statement}")
+        if problems:
+            exit_code = 1
+        else:
+            print("No unexpected full table scans")
+    transactions, commits, failed = check_group_commit(database.engine, database.SessionLocal)
+    print(f"Group commit: {GROUP_COMMIT_JOBS} jobs, {failed} failed, "
+          f"{transactions} transaction(s), {commits} COMMIT(s)")
+    if (transactions, commits, failed) != (1, 1, 0):
+        exit_code = 1
+    drifted = check_session_stats(database.SessionLocal, ctx["session_without_stats"])
+    if drifted:
+        print(f"SESSION STATS differ from session_questions: sessions {drifted}")
+        exit_code = 1
+    else:
+        print("Session stats match session_questions")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance, args.noise_ms)
+        for name, reasons in regressions:
+            print(f"REGRESSION {name}: {'; '.join(reasons)}")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"No regressions against {args.baseline}")
+    if args.save_baseline:
+        meta = {name: getattr(args, name) for name in (
+            "questions", "tags", "acts", "act_depth", "times", "sessions", "session_questions", "test_items",
+            "requests", "seed",
+        )}
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump({"meta": meta, "results": results}, file, ensure_ascii=False, indent=2)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Пакетные операции для вопросов, тегов и занятий.
+
+Каждая функция сначала проверяет весь пакет несколькими запросами с IN,
+затем записывает корректные элементы пакетными запросами. Коммит делает
+вызывающая сторона - один на весь пакет. Результат - список по элементам
+в порядке запроса: {"index", "ok", "id"} или {"index", "ok": False, "error"}.
+"""
+from sqlalchemy import delete, insert, text, update
+from sqlalchemy.orm import Session
+from models import (
+    Act, ActClosure, ActNote, Question, QuestionReview, SessionQuestion, Tag, Task, Time, Timer,
+    question_tags,
+)
+from act_tree import is_descendant, move_in_closure
+from scheduler import review_questions
+from study import add_status_change, apply_stats_deltas, register_shows
+
+
+def ok(index, item_id):
+    return {"index": index, "ok": True, "id": item_id}
+
+
+def failed(index, error, item_id=None):
+    return {"index": index, "ok": False, "id": item_id, "error": error}
+
+
+def resolve_tags(db: Session, slugs):
+    """Существующие slug'и из списка - одним запросом с IN"""
+    slugs = set(slugs)
+    if not slugs:
+        return set()
+    return {slug for (slug,) in db.query(Tag.slug).filter(Tag.slug.in_(slugs))}
+
+
+def set_question_tags(db: Session, tag_slugs_by_question, existing_tags, replace=False):
+    """Записать связи вопрос-тег одним INSERT (неизвестные теги пропускаются)"""
+    if replace and tag_slugs_by_question:
+        db.execute(delete(question_tags).where(question_tags.c.question_id.in_(list(tag_slugs_by_question))))
+    rows = [
+        {"question_id": question_id, "tag_slug": slug}
+        for question_id, slugs in tag_slugs_by_question.items()
+        for slug in dict.fromkeys(slugs)
+        if slug in existing_tags
+    ]
+    if rows:
+        db.execute(insert(question_tags), rows)
+
+
+def create_questions(db: Session, items):
+    if not items:
+        return []
+    existing_tags = resolve_tags(db, [slug for item in items for slug in item.tag_slugs])
+    ids = db.execute(
+        insert(Question).returning(Question.id, sort_by_parameter_order=True),
+        [{"q": item.q, "a": item.a, "difficulty": item.difficulty} for item in items]
+    ).scalars().all()
+    set_question_tags(db, {question_id: item.tag_slugs for question_id, item in zip(ids, items)}, existing_tags)
+    return [ok(index, question_id) for index, question_id in enumerate(ids)]
+
+
+def update_questions(db: Session, items):
+    ids = [item.id for item in items]
+    found = {question_id for (question_id,) in db.query(Question.id).filter(Question.id.in_(ids))}
+    existing_tags = resolve_tags(db, [slug for item in items for slug in item.tag_slugs])
+
+    results, rows, tags = [], [], {}
+    for index, item in enumerate(items):
+        if item.id not in found:
+            results.append(failed(index, "Question not found", item.id))
+        elif item.id in tags:
+            results.append(failed(index, "Duplicate id in batch", item.id))
+        else:
+            rows.append({"id": item.id, "q": item.q, "a": item.a, "difficulty": item.difficulty})
+            tags[item.id] = item.tag_slugs
+            results.append(ok(index, item.id))
+
+    if rows:
+        # ORM bulk UPDATE по первичному ключу: один executemany
+        db.execute(update(Question), rows)
+        set_question_tags(db, tags, existing_tags, replace=True)
+    return results
+
+
+def delete_questions(db: Session, ids):
+    found = {question_id for (question_id,) in db.query(Question.id).filter(Question.id.in_(ids))}
+    in_sessions = {
+        question_id for (question_id,) in
+        db.query(SessionQuestion.question_id).filter(SessionQuestion.question_id.in_(ids)).distinct()
+    }
+
+    results, to_delete = [], []
+    for index, question_id in enumerate(ids):
+        if question_id not in found:
+            results.append(failed(index, "Question not found", question_id))
+        elif question_id in in_sessions:
+            results.append(failed(index, "Question is used in study sessions", question_id))
+        else:
+            to_delete.append(question_id)
+            results.append(ok(index, question_id))
+
+    if to_delete:
+        db.execute(delete(question_tags).where(question_tags.c.question_id.in_(to_delete)))
+        db.execute(delete(QuestionReview).where(QuestionReview.question_id.in_(to_delete)))
+        db.query(Question).filter(Question.id.in_(to_delete)).delete(synchronize_session=False)
+    return results
+
+
+def rate_questions(db: Session, session_id: int, items):
+    """Оценки вопросов сессии: статусы, счётчики сессии одним UPDATE и расписание повторений"""
+    session_questions = {
+        session_question.question_id: session_question
+        for session_question in db.query(SessionQuestion).filter(
+            SessionQuestion.session_id == session_id,
+            SessionQuestion.question_id.in_({item.question_id for item in items})
+        )
+    }
+
+    results, deltas, rated = [], {}, []
+    for index, item in enumerate(items):
+        session_question = session_questions.get(item.question_id)
+        if session_question is None:
+            results.append(failed(index, "Question not found in session", item.question_id))
+            continue
+        add_status_change(deltas, session_question.status, item.rating)
+        session_question.status = item.rating
+        rated.append((item.question_id, item.rating))
+        results.append(ok(index, item.question_id))
+
+    apply_stats_deltas(db, session_id, deltas)
+    review_questions(db, rated)
+    return results
+
+
+def record_shows(db: Session, session_id: int, question_ids):
+    """Показы вопросов сессии: строки session_questions и счётчики сессии пачкой"""
+    found = {question_id for (question_id,) in db.query(Question.id).filter(Question.id.in_(set(question_ids)))}
+    results, shown = [], []
+    for index, question_id in enumerate(question_ids):
+        if question_id not in found:
+            results.append(failed(index, "Question not found", question_id))
+        else:
+            shown.append(question_id)
+            results.append(ok(index, question_id))
+    if shown:
+        register_shows(db, session_id, shown)
+    return results
+
+
+def create_tags(db: Session, items):
+    existing = resolve_tags(db, [item.slug for item in items])
+    results, rows, seen = [], [], set()
+    for index, item in enumerate(items):
+        if item.slug in existing or item.slug in seen:
+            results.append(failed(index, "Такой тэг уже существует", item.slug))
+        else:
+            seen.add(item.slug)
+            rows.append({"slug": item.slug, "title": item.title})
+            results.append(ok(index, item.slug))
+    if rows:
+        db.execute(insert(Tag), rows)
+    return results
+
+
+def update_tags(db: Session, items):
+    existing = resolve_tags(db, [item.slug for item in items])
+    results, rows = [], []
+    for index, item in enumerate(items):
+        if item.slug not in existing:
+            results.append(failed(index, "Такого тэга нет", item.slug))
+        else:
+            rows.append({"slug": item.slug, "title": item.title})
+            results.append(ok(index, item.slug))
+    if rows:
+        db.execute(update(Tag), rows)
+    return results
+
+
+def delete_tags(db: Session, slugs):
+    existing = resolve_tags(db, slugs)
+    results = [
+        ok(index, slug) if slug in existing else failed(index, "Такого тэга нет", slug)
+        for index, slug in enumerate(slugs)
+    ]
+    if existing:
+        db.execute(delete(question_tags).where(question_tags.c.tag_slug.in_(existing)))
+        db.query(Tag).filter(Tag.slug.in_(existing)).delete(synchronize_session=False)
+    return results
+
+
+def existing_act_ids(db: Session, ids):
+    ids = {act_id for act_id in ids if act_id is not None}
+    if not ids:
+        return set()
+    return {act_id for (act_id,) in db.query(Act.id).filter(Act.id.in_(ids))}
+
+
+def create_acts(db: Session, items):
+    parents = existing_act_ids(db, [item.parent_id for item in items])
+    results, valid = [], []
+    for index, item in enumerate(items):
+        if item.parent_id is not None and item.parent_id not in parents:
+            results.append(failed(index, "Parent act not found"))
+        else:
+            valid.append((index, item))
+            results.append(None)
+
+    if valid:
+        ids = db.execute(
+            insert(Act).returning(Act.id, sort_by_parameter_order=True),
+            [
+                {"title": item.title, "start_date": item.start_date, "end_date": item.end_date,
+                 "parent_id": item.parent_id, "hidden": item.hidden, "sort_order": item.sort_order}
+                for _, item in valid
+            ]
+        ).scalars().all()
+
+        # Таблица замыкания: строки "сам себе" и строки предков родителя, по одному executemany
+        db.execute(insert(ActClosure), [{"ancestor_id": act_id, "descendant_id": act_id, "depth": 0} for act_id in ids])
+        with_parent = [
+            {"act_id": act_id, "parent_id": item.parent_id}
+            for act_id, (_, item) in zip(ids, valid) if item.parent_id is not None
+        ]
+        if with_parent:
+            db.execute(text(
+                "INSERT INTO act_closure (ancestor_id, descendant_id, depth) "
+                "SELECT ancestor_id, :act_id, depth + 1 FROM act_closure WHERE descendant_id = :parent_id"
+            ), with_parent)
+
+        for act_id, (index, _) in zip(ids, valid):
+            results[index] = ok(index, act_id)
+    return results
+
+
+def update_acts(db: Session, items):
+    """Обновление занятий. Переносы в иерархии применяются по порядку пакета"""
+    acts = {act.id: act for act in db.query(Act).filter(Act.id.in_([item.id for item in items]))}
+    parents = existing_act_ids(db, [item.parent_id for item in items])
+
+    results = []
+    for index, item in enumerate(items):
+        act = acts.get(item.id)
+        if act is None:
+            results.append(failed(index, "Act not found", item.id))
+            continue
+        if item.parent_id != act.parent_id:
+            if item.parent_id is not None and item.parent_id not in parents:
+                results.append(failed(index, "Parent act not found", item.id))
+                continue
+            if item.parent_id is not None and is_descendant(db, item.parent_id, item.id):
+                results.append(failed(index, "Act cannot be moved under its own descendant", item.id))
+                continue
+            move_in_closure(db, item.id, item.parent_id)
+            act.parent_id = item.parent_id
+
+        act.title = item.title
+        act.start_date = item.start_date
+        act.end_date = item.end_date
+        act.hidden = item.hidden
+        act.sort_order = item.sort_order
+        results.append(ok(index, item.id))
+    db.flush()
+    return results
+
+
+def delete_acts(db: Session, ids):
+    """Удаление занятий без потомков и без связанных данных"""
+    found = existing_act_ids(db, ids)
+    in_use = set()
+    for column in (Act.parent_id, Task.act_id, ActNote.act_id, Time.act_id, Timer.act_id):
+        in_use |= {act_id for (act_id,) in db.query(column).filter(column.in_(found)).distinct()}
+
+    results, to_delete = [], []
+    for index, act_id in enumerate(ids):
+        if act_id not in found:
+            results.append(failed(index, "Act not found", act_id))
+        elif act_id in in_use:
+            results.append(failed(index, "Act has children or related records", act_id))
+        else:
+            to_delete.append(act_id)
+            results.append(ok(index, act_id))
+
+    if to_delete:
+        db.execute(delete(ActClosure).where(ActClosure.descendant_id.in_(to_delete)))
+        db.query(Act).filter(Act.id.in_(to_delete)).delete(synchronize_session=False)
+    return results
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", 1024))
+CACHE_TTL = float(os.getenv("CACHE_TTL", 300))  # секунды
+
+
+class TTLCache:
+    """Ограниченный LRU-кэш с временем жизни записей.
+
+    Ключ - кортеж, первый элемент которого - пространство имён эндпоинта
+    ("tags", "question", ...), последний - ETag версии данных. invalidate
+    удаляет все ключи с заданным префиксом, так что можно сбросить и одну
+    запись, и всё пространство.
+
+    Читающие процессы не получают событий инвалидации от писателя и узнают
+    о записи только по новому ETag. Поэтому set с новым ETag пространства
+    сразу удаляет его записи со старыми ETag: после записи в памяти не
+    остаётся вторая копия каталога до истечения ttl.
+    """
+
+    def __init__(self, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # ключ -> (срок годности, значение)
+        self.etags = {}  # пространство имён -> последний закэшированный ETag
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        self.superseded = 0
+
+    def get(self, key):
+        """(True, значение) при попадании, (False, None) при промахе"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self.lock:
+            self._drop_superseded(key)
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def _drop_superseded(self, key):
+        """Удалить записи пространства key[0] с ETag, отличным от key[-1]"""
+        namespace, etag = key[0], key[-1]
+        if len(key) < 2 or self.etags.get(namespace) == etag:
+            return
+        self.etags[namespace] = etag
+        stale = [
+            cached for cached in self.entries
+            if cached[0] == namespace and cached[-1] != etag
+        ]
+        for cached in stale:
+            del self.entries[cached]
+        self.superseded += len(stale)
+
+    def get_or_load(self, key, loader):
+        found, value = self.get(key)
+        if not found:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, *prefix):
+        with self.lock:
+            keys = [key for key in self.entries if key[:len(prefix)] == prefix]
+            for key in keys:
+                del self.entries[key]
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.etags.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "superseded": self.superseded,
+            }
+
+
+# Кэш каталога: тэги и вопросы
+catalog_cache = TTLCache()
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -7,13 +8,84 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:////data/data.db")
 
 # os.makedirs(os.path.dirname(DATABASE_URL.replace("sqlite:///", "")), exist_ok=True)
 
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_POSTGRES = DATABASE_URL.startswith("postgresql")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# Профиль SQLite, применяется к каждому новому соединению
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64000)),  # отрицательное значение - в КиБ
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),  # мс
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", 10))
+
+# Профиль пула PostgreSQL (QueuePool). pre_ping отсеивает соединения,
+# закрытые сервером, recycle - не держит соединение дольше N секунд
+POSTGRES_POOL = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", 10)),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 20)),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    "pool_pre_ping": True,
+}
+POSTGRES_STATEMENT_TIMEOUT = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT", 30000))  # мс
+
+
+def apply_sqlite_pragmas(dbapi_connection, read_only=False):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        # Запрет записи ставим последним: journal_mode=WAL сохраняется в файле БД
+        # и может быть выставлен первым же соединением, в том числе читающим
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+def make_postgres_engine(read_only=False):
+    options = f"-c statement_timeout={POSTGRES_STATEMENT_TIMEOUT}"
+    pool = dict(POSTGRES_POOL)
+    if read_only:
+        options += " -c default_transaction_read_only=on"
+        pool["pool_size"] = READ_POOL_SIZE
+    return create_engine(DATABASE_URL, connect_args={"options": options}, **pool)
+
+
+def make_engine(read_only=False):
+    if IS_POSTGRES:
+        return make_postgres_engine(read_only=read_only)
+    if not IS_SQLITE:
+        return create_engine(DATABASE_URL)
+
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if read_only:
+        kwargs["pool_size"] = READ_POOL_SIZE
+    new_engine = create_engine(DATABASE_URL, **kwargs)
+
+    @event.listens_for(new_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, read_only=read_only)
+
+    return new_engine
+
+
+engine = make_engine()
+
+# Отдельный пул только для чтения: в режиме WAL читатели не ждут писателя.
+# Для БД в памяти второй пул увидел бы другую базу, поэтому используем основной.
+if IS_POSTGRES or (IS_SQLITE and ":memory:" not in DATABASE_URL):
+    read_engine = make_engine(read_only=True)
+else:
+    read_engine = engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -22,4 +94,23 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    """Сессия для GET-обработчиков, которые ничего не пишут"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def dialect_insert(db):
+    """insert() диалекта сессии - с on_conflict_do_update для upsert.
+
+    У SQLite и PostgreSQL одинаковый синтаксис ON CONFLICT, отличается
+    только модуль, из которого берётся insert.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
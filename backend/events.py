@@ -0,0 +1,79 @@
+import asyncio
+import json
+import os
+import threading
+
+# Интервал комментария-keepalive в потоке SSE (секунды)
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", 15))
+# Сколько событий держим для медленного клиента, старые отбрасываются
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def format_event(topic, data):
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {topic}\ndata: {payload}\n\n"
+
+
+class Subscription:
+    def __init__(self, topics, loop):
+        self.topics = set(topics)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def matches(self, topic):
+        return topic in self.topics or topic.split(":", 1)[0] + ":*" in self.topics
+
+
+def _put(queue, message):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class Broadcaster:
+    """Рассылка событий подписчикам внутри процесса.
+
+    publish можно вызывать из обработчиков в пуле потоков: сообщение
+    передаётся в цикл событий подписчика через call_soon_threadsafe.
+    Подписчик без событий ничего не стоит - он просто ждёт очередь.
+    Темы: "timers", "session:<id>" ("session:*" - все сессии).
+    """
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics, asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, topic, data):
+        message = format_event(topic, data)
+        with self.lock:
+            subscriptions = [s for s in self.subscriptions if s.matches(topic)]
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(_put, subscription.queue, message)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                self.unsubscribe(subscription)
+
+    async def stream(self, request, subscription):
+        """Генератор для StreamingResponse с text/event-stream"""
+        try:
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), timeout=SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,117 @@
+import json
+from sqlalchemy import MetaData, inspect, select, text, tuple_
+from sqlalchemy.orm import Session
+from database import ReadSessionLocal
+
+CHUNK_SIZE = 1000
+
+# Служебные столбцы, которых нет в данных пользователя: сентинелы пакетного
+# INSERT ... RETURNING (models.Act._sentinel) в выгрузку не попадают
+HIDDEN_COLUMNS = {"_sentinel"}
+
+
+def list_tables(db: Session):
+    """Обычные таблицы БД в порядке имени.
+
+    Виртуальные таблицы (FTS5) и их служебные таблицы пропускаются:
+    их содержимое производно от основных таблиц.
+    """
+    names = sorted(inspect(db.connection()).get_table_names())
+    if db.get_bind().dialect.name != "sqlite":
+        return names
+
+    virtual = [name for (name,) in db.execute(text(
+        "SELECT name FROM sqlite_master WHERE type='table' AND sql LIKE 'CREATE VIRTUAL TABLE%'"
+    ))]
+    return [
+        name for name in names
+        if name not in virtual and not any(name.startswith(f"{vt}_") for vt in virtual)
+    ]
+
+
+def iter_export(tables, after_table=None, after_rowid=None, chunk_size=CHUNK_SIZE):
+    """Построчная выгрузка таблиц в NDJSON.
+
+    Каждая таблица читается кусками по chunk_size строк (см. read_chunks),
+    отдельной короткой выборкой на кусок, поэтому память постоянна, а
+    транзакция чтения не держится на всё время выгрузки. Каждая строка
+    выгрузки содержит таблицу и rowid - по ним можно продолжить
+    прерванную выгрузку (after_table, after_rowid).
+    """
+    db = ReadSessionLocal()
+    try:
+        metadata = MetaData()
+        if db.get_bind().dialect.name != "sqlite":
+            # Структура всех таблиц - одним проходом по каталогу, а не по таблице
+            metadata.reflect(db.connection(), only=tables)
+            db.commit()
+        started = after_table is None
+        for table in tables:
+            last_rowid = None
+            if not started:
+                if table != after_table:
+                    continue
+                started = True
+                last_rowid = after_rowid
+
+            for rows in read_chunks(db, metadata, table, last_rowid, chunk_size):
+                lines = [
+                    json.dumps({"table": table, "rowid": rowid, "row": data}, ensure_ascii=False, default=str)
+                    for rowid, data in rows
+                ]
+                yield "\n".join(lines) + "\n"
+    finally:
+        db.close()
+
+
+def read_chunks(db: Session, metadata, table, after_rowid=None, chunk_size=CHUNK_SIZE):
+    """Куски строк таблицы после позиции after_rowid: списки (rowid, row).
+
+    На SQLite позиция - настоящий rowid (WHERE rowid > :last ORDER BY
+    rowid LIMIT n). В PostgreSQL rowid нет, поэтому позиция - номер
+    строки в порядке первичного ключа, структура таблицы берётся из
+    metadata. Первый кусок пропускает after_rowid строк, следующие
+    продолжают по ключу (keyset).
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        last_rowid = -1 if after_rowid is None else after_rowid
+        while True:
+            rows = db.execute(
+                text(f'SELECT rowid AS "__rowid__", * FROM "{table}" WHERE rowid > :last ORDER BY rowid LIMIT :limit'),
+                {"last": last_rowid, "limit": chunk_size}
+            ).mappings().all()
+            db.commit()  # Завершаем транзакцию чтения между кусками
+            if not rows:
+                return
+            chunk = []
+            for row in rows:
+                data = {name: value for name, value in row.items() if name not in HIDDEN_COLUMNS}
+                last_rowid = data.pop("__rowid__")
+                chunk.append((last_rowid, data))
+            yield chunk
+            if len(rows) < chunk_size:
+                return
+
+    reflected = metadata.tables[table]
+    key = list(reflected.primary_key.columns) or list(reflected.columns)
+    columns = [column for column in reflected.columns if column.name not in HIDDEN_COLUMNS]
+    statement = select(*columns).order_by(*key).limit(chunk_size)
+    position = after_rowid or 0
+    last_key = None
+    while True:
+        if last_key is None:
+            page = statement.offset(position)
+        else:
+            page = statement.where(tuple_(*key) > tuple_(*last_key))
+        rows = db.execute(page).mappings().all()
+        db.commit()
+        if not rows:
+            return
+        chunk = []
+        for row in rows:
+            position += 1
+            chunk.append((position, dict(row)))
+        last_key = [rows[-1][column.name] for column in key]
+        yield chunk
+        if len(rows) < chunk_size:
+            return
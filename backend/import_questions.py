@@ -1,128 +1,221 @@
+import hashlib
 import io
 import re
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, insert, select, update
 from database import get_db
-from models import Question, Tag
+from models import Question, Tag, question_tags
+import versions  # noqa: F401 - счётчики версий таблиц для ETag
 
 qa_filename = "./q.md"
 
-def read_questions():
-    with io.open(qa_filename, "r", encoding="utf-8") as file:
-        full_text = file.read()
-        categories = []
-        pattern = r"# ([a-zA-Zа-яА-Я -]+) \d+"  # Извлекаем только текст
-        categories = re.findall(pattern, full_text)
-    return full_text, categories
-
-def get_questions(cat_text):
-    pattern = r"\d+ u?f"
-    questions = re.findall(pattern, cat_text)
-    return questions
-
-def fill_cat(categories_names, cat_name, cat_text, full_question_list):
-    questions = get_questions(cat_text)
-    print(f"Категория '{cat_name}': найдено {len(questions)} вопросов")
-    
-    for idx, q in enumerate(questions):
-        q_text = cat_text[cat_text.find(q)+len(q):]
-        q_text = q_text.split("\n\n")[0].strip()
-        question = q_text[:q_text.find("\n")]
-        i = 0
-        if len(full_question_list) > 0:
-            i = full_question_list[-1]["index"] + 1
-
-        full_question_list.append({
-            "category": cat_name, 
-            "number": q, 
-            "question": question, 
-            "answer": q_text[q_text.find("\n"):].strip(), 
-            "index": i
-        })
-        if cat_name not in categories_names:
-            categories_names.append(cat_name)
-
-def fill_dct(cats, categories_names, full_text, full_question_list):
-    # Исправленная логика - используем индексы заголовков
-    header_pattern = r"# [a-zA-Zа-яА-Я -]+ \d+"
-    header_matches = list(re.finditer(header_pattern, full_text))
-    
-    print(f"Найдено {len(header_matches)} заголовков")
-    
-    for i, match in enumerate(header_matches):
-        header_text = match.group()
-        if "Статистика" in header_text:
-            continue
-            
-        # Извлекаем название категории
-        pattern = r"[a-zA-Zа-яА-Я -]+"
-        name = re.findall(pattern, header_text)
-        cat_name = name[0].strip()
-        
-        # Определяем границы раздела
-        start_pos = match.end()  # После заголовка
-        if i + 1 < len(header_matches):
-            end_pos = header_matches[i + 1].start()  # До следующего заголовка
-        else:
-            end_pos = len(full_text)  # До конца файла
-        
-        cat_text = full_text[start_pos:end_pos].strip()
-        
-        print(f"Обрабатываем '{cat_name}': позиции {start_pos}-{end_pos}")
-        fill_cat(categories_names, cat_name, cat_text, full_question_list)
-
-def import_questions_to_db():
-    """Импорт вопросов в базу данных (теги уже существуют)"""
-    # Получаем данные из файла
-    full_text, categories = read_questions()
-    full_question_list = []
-    categories_names = []
-    fill_dct(categories, categories_names, full_text, full_question_list)
-    print(f"Всего найдено: {len(full_question_list)} вопросов")
-    
-    # Показываем статистику по категориям
-    print("\n📊 Статистика по категориям:")
-    for cat_name in categories_names:
-        count = len([q for q in full_question_list if q['category'] == cat_name])
-        print(f"  {cat_name}: {count} вопросов")
+# Заголовок категории: "# linux 9" (число - количество вопросов)
+HEADER_PATTERN = re.compile(r"# ([a-zA-Zа-яА-Я_ -]+) \d+")
+# Маркер вопроса: "12 f" или "12 uf" на отдельной строке
+MARKER_PATTERN = re.compile(r"(\d+) u?f")
+FENCE = "```"
+
+BATCH_SIZE = 500
+
+
+def content_hash(question, answer):
+    return hashlib.sha256(f"{question}\n{answer}".encode("utf-8")).hexdigest()
+
+
+def iter_questions(filename=qa_filename):
+    """Однопроходный потоковый разбор q.md.
+
+    Читает файл построчно и выдаёт словари с категорией, номером, текстом
+    вопроса и ответа. Вопрос - первая строка после маркера, ответ - строки
+    до первой пустой строки вне блока кода. Заголовки и маркеры внутри
+    блоков кода не учитываются.
+    """
+    category = None
+    current = None
+    in_fence = False
+
+    def finish(item):
+        lines = item["lines"]
+        return {
+            "category": item["category"],
+            "number": item["number"],
+            "question": lines[0].strip() if lines else "",
+            "answer": "\n".join(lines[1:]).strip(),
+        }
+
+    with io.open(filename, "r", encoding="utf-8") as file:
+        for raw_line in file:
+            line = raw_line.rstrip("\n")
+            stripped = line.strip()
+
+            if not in_fence:
+                header = HEADER_PATTERN.fullmatch(line)
+                marker = MARKER_PATTERN.fullmatch(line)
+                if header or marker:
+                    if current and current["lines"]:
+                        yield finish(current)
+                    current = None
+                    if header:
+                        category = header.group(1).strip()
+                        if "Статистика" in category:
+                            category = None
+                    elif category:
+                        current = {"category": category, "number": marker.group(1), "lines": []}
+                    continue
+
+                if not stripped:
+                    # Пустая строка вне блока кода завершает ответ
+                    if current and current["lines"]:
+                        yield finish(current)
+                        current = None
+                    continue
+
+            if stripped.startswith(FENCE):
+                in_fence = not in_fence
+            if current is not None:
+                current["lines"].append(line)
+
+    if current and current["lines"]:
+        yield finish(current)
+
+
+def iter_batches(items, size=BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_legacy_questions(db):
+    """Вопросы без source_key - из импорта, который ещё не знал ключей.
+
+    Возвращает индексы для сопоставления с q.md: хэш содержимого -> [id] и
+    (категория, текст вопроса) -> [id]. Прежний разбор иначе делил ответы
+    с пустыми строками внутри блоков кода, поэтому хэш совпадает не всегда,
+    а текст вопроса - первая строка после маркера - совпадает. Ответы в
+    памяти не держатся: хэш считается по мере чтения.
+    """
+    by_hash, by_question = {}, {}
+    rows = db.execute(
+        select(Question.id, Question.q, Question.a, question_tags.c.tag_slug)
+        .outerjoin(question_tags, question_tags.c.question_id == Question.id)
+        .where(Question.source_key.is_(None))
+        .order_by(Question.id)
+    )
+    for question_id, question, answer, tag_slug in rows:
+        ids = by_hash.setdefault(content_hash(question, answer), [])
+        if question_id not in ids:
+            ids.append(question_id)
+        # Старый разбор не обрезал пробелы в конце строки вопроса
+        by_question.setdefault((tag_slug, question.strip()), []).append(question_id)
+    return by_hash, by_question
 
-    # Подключаемся к БД
+
+def claim_legacy_question(legacy, claimed, q_data):
+    """id старого вопроса для записи q.md или None; каждый вопрос берётся один раз"""
+    by_hash, by_question = legacy
+    for candidates in (
+        by_hash.get(q_data["content_hash"], ()),
+        by_question.get((q_data["category"], q_data["question"]), ()),
+    ):
+        for question_id in candidates:
+            if question_id not in claimed:
+                claimed.add(question_id)
+                return question_id
+    return None
+
+
+def import_questions_to_db(filename=qa_filename):
+    """Импорт вопросов в базу данных (теги уже существуют).
+
+    Вопрос идентифицируется ключом "категория/номер". Новые вопросы
+    вставляются пачками, изменённые (другой хэш содержимого) обновляются,
+    неизменённые пропускаются, поэтому повторный запуск не создаёт дублей.
+    Вопросы, загруженные старым импортом без ключей, не дублируются, а
+    получают ключ (см. load_legacy_questions).
+    """
     db = next(get_db())
-    
+    stats = {}
+    seen_keys = {}
+    claimed = set()
+    inserted_count = updated_count = skipped_count = linked_count = 0
+
     try:
-        # Создаем маппинг категорий к существующим тегам
-        tag_mapping = {}
-        for cat_name in categories_names:
-            tag = db.query(Tag).filter(Tag.slug == cat_name).first()
-            tag_mapping[cat_name] = tag
-
-        imported_count = 0
-        for q_data in full_question_list:
-            tag = tag_mapping.get(q_data['category'])
-            if not tag:
-                print(f"Пропускаем вопрос из категории '{q_data['category']}' - тег не найден")
-                continue
-                
-            # Создаем вопрос
-            question = Question(
-                q=q_data['question'],
-                a=q_data['answer']
+        tag_slugs = {slug for (slug,) in db.query(Tag.slug).all()}
+        legacy = load_legacy_questions(db)
+
+        def with_keys(items):
+            for q_data in items:
+                key = f"{q_data['category']}/{q_data['number']}"
+                # Номера в q.md иногда повторяются внутри категории
+                seen_keys[key] = seen_keys.get(key, 0) + 1
+                if seen_keys[key] > 1:
+                    key = f"{key}#{seen_keys[key]}"
+                q_data["source_key"] = key
+                q_data["content_hash"] = content_hash(q_data["question"], q_data["answer"])
+                yield q_data
+
+        for batch in iter_batches(with_keys(iter_questions(filename))):
+            existing = dict(
+                db.query(Question.source_key, Question.content_hash).filter(
+                    Question.source_key.in_([q_data["source_key"] for q_data in batch])
+                ).all()
             )
-            db.add(question)
-            db.flush()  # Получаем ID
-            
-            # Связываем с тегом
-            question.tags.append(tag)
-            imported_count += 1
-        
+
+            new_rows, changed_rows, legacy_rows = [], [], []
+            for q_data in batch:
+                category = q_data["category"]
+                stats[category] = stats.get(category, 0) + 1
+                if category not in tag_slugs:
+                    skipped_count += 1
+                    continue
+
+                row = {
+                    "q": q_data["question"],
+                    "a": q_data["answer"],
+                    "source_key": q_data["source_key"],
+                    "content_hash": q_data["content_hash"],
+                }
+                if q_data["source_key"] not in existing:
+                    legacy_id = claim_legacy_question(legacy, claimed, q_data)
+                    if legacy_id is None:
+                        new_rows.append(row)
+                    else:
+                        legacy_rows.append({"id": legacy_id, **row})
+                elif existing[q_data["source_key"]] != q_data["content_hash"]:
+                    changed_rows.append(row)
+
+            if new_rows:
+                inserted = db.execute(
+                    insert(Question).returning(Question.id, Question.source_key),
+                    new_rows
+                ).all()
+                # source_key начинается с категории, она же slug тега
+                db.execute(insert(question_tags), [
+                    {"question_id": question_id, "tag_slug": source_key.split("/", 1)[0]}
+                    for question_id, source_key in inserted
+                ])
+                inserted_count += len(inserted)
+
+            if legacy_rows:
+                # ORM bulk UPDATE по первичному ключу: ключ, хэш и текст из q.md
+                db.execute(update(Question), legacy_rows)
+                linked_count += len(legacy_rows)
+
+            if changed_rows:
+                questions_table = Question.__table__
+                db.execute(
+                    update(questions_table)
+                    .where(questions_table.c.source_key == bindparam("b_source_key"))
+                    .values(q=bindparam("b_q"), a=bindparam("b_a"), content_hash=bindparam("b_content_hash")),
+                    [{f"b_{name}": value for name, value in row.items()} for row in changed_rows]
+                )
+                updated_count += len(changed_rows)
+
         db.commit()
-        print(f"✅ Импортировано {imported_count} вопросов")
-        
-        # Показываем статистику по тегам
-        print("\n📊 Статистика импорта:")
-        for cat_name, tag in tag_mapping.items():
-            questions_count = len([q for q in full_question_list if q['category'] == cat_name])
-            print(f"  {tag.title}: {questions_count} вопросов")
-        
     except Exception as e:
         db.rollback()
         print(f"❌ Ошибка импорта: {e}")
@@ -130,5 +223,17 @@ def import_questions_to_db():
     finally:
         db.close()
 
+    print(f"Всего найдено: {sum(stats.values())} вопросов")
+    print("\n📊 Статистика по категориям:")
+    for cat_name, count in stats.items():
+        print(f"  {cat_name}: {count} вопросов")
+
+    print(f"\n✅ Добавлено {inserted_count}, обновлено {updated_count} вопросов")
+    if linked_count:
+        print(f"Привязано к q.md {linked_count} вопросов старого импорта")
+    if skipped_count:
+        print(f"Пропущено {skipped_count} вопросов - тег категории не найден")
+
+
 if __name__ == "__main__":
-    import_questions_to_db()
\ No newline at end of file
+    import_questions_to_db()
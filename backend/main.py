@@ -1,15 +1,94 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, Body
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from database import get_db, Base, engine
-from models import TestItem, Act, Tag, Question, StudySession, SessionQuestion
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.orm import Session, selectinload, undefer
+from database import get_db, get_read_db, Base, engine, SessionLocal
+from models import (
+    TestItem, Act, Tag, Question, QuestionReview, StudySession, SessionQuestion, SessionStats,
+    question_tags,
+)
+from search import search_questions
+from export import list_tables, iter_export, CHUNK_SIZE
+from act_tree import add_to_closure, move_in_closure, is_descendant, load_tree, descendant_ids
+import bulk
+from cache import catalog_cache
+from metrics import MetricsMiddleware, metrics
+from serialization import (
+    json_response, select_acts, select_questions, select_study_sessions, select_tags,
+    select_test_items, join_search_hits, question_facets, select_questions_by_id,
+    select_question_answer, select_time, QUESTION_FIELDS,
+)
+from versions import check_etag, table_etag, TAGS_TABLES, QUESTIONS_TABLES, ACTS_TABLES
+from time_reports import record_time, set_time, time_report
+from timers import timer_service, TIMER_FLUSH_INTERVAL
+from events import broadcaster
+from writer import write_queue
+from study import (
+    pick_question_id, pick_question_ids, register_shows, get_session_stats, read_session_stats, bump_session_stats
+)
+from scheduler import review_question, review_to_dict, due_reviews
 from pydantic import BaseModel, HttpUrl, field_validator
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Optional, List, Literal
+from contextlib import asynccontextmanager
+import anyio
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Обработчики с БД объявлены через def: FastAPI выполняет их в пуле потоков,
+# и синхронные запросы SQLAlchemy не блокируют цикл событий
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", 40))
+
+# Сколько вопросов можно запросить за раз в next-questions
+MAX_PREFETCH = 50
+
+# Ответы от этого размера (в байтах) сжимаются gzip, если клиент его принимает
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", 1000))
+
+# Роль процесса (см. docker-compose.workers.yml): all - всё в одном процессе,
+# writer - записи, таймеры и SSE, reader - только чтение, таймеры не ведёт
+WORKER_ROLE = os.getenv("WORKER_ROLE", "all")
+
+
+async def flush_timers_periodically():
+    """Периодически записывать время работающих таймеров в times"""
+    while True:
+        await asyncio.sleep(TIMER_FLUSH_INTERVAL)
+        try:
+            await anyio.to_thread.run_sync(timer_service.flush)
+        except Exception:
+            logger.exception("Timer flush failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    if WORKER_ROLE == "reader":
+        yield
+        return
+
+    # Таймеры живут в памяти, поэтому их ведёт только один процесс
+    db = SessionLocal()
+    try:
+        timer_service.restore(db)
+    finally:
+        db.close()
+    flush_task = asyncio.create_task(flush_timers_periodically())
+    write_queue.start()
+
+    yield
+
+    flush_task.cancel()
+    await anyio.to_thread.run_sync(timer_service.flush)
+    await anyio.to_thread.run_sync(write_queue.stop)
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,12 +99,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
+app.add_middleware(MetricsMiddleware)
 
 class ActItemCreate(BaseModel):
     title: str = ""
     start_date: Optional[date] = None
     end_date: Optional[date] = None
     parent_id: Optional[int] = None
+    hidden: bool = False
+    sort_order: int = 0
 
     @field_validator('start_date', 'end_date')
     @classmethod
@@ -47,6 +130,11 @@ class ActItemResponse(BaseModel):
     start_date: Optional[date] = None
     end_date: Optional[date] = None
     parent_id: Optional[int] = None
+    hidden: Optional[bool] = None
+    sort_order: Optional[int] = None
+
+class ActTreeNode(ActItemResponse):
+    children: List["ActTreeNode"] = []
 
 
 
@@ -84,6 +172,45 @@ class QuestionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class QuestionAnswer(BaseModel):
+    id: int
+    a: str
+
+class QuestionUpdateItem(QuestionCreate):
+    id: int
+
+class ActUpdateItem(ActItemCreate):
+    id: int
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    id: Optional[int | str] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
+
+class QuestionSearchResult(BaseModel):
+    id: int
+    q: str
+    difficulty: Optional[str] = None
+    tags: List[TagSchema] = []
+    rank: float
+    q_snippet: str
+    a_snippet: str
+
+class TagFacet(TagSchema):
+    count: int
+
+class DifficultyFacet(BaseModel):
+    difficulty: Optional[str] = None
+    count: int
+
+class QuestionFacets(BaseModel):
+    tags: List[TagFacet]
+    difficulties: List[DifficultyFacet]
+
 # Модели для учебных сессий
 class StudySessionCreate(BaseModel):
     name: str
@@ -115,32 +242,195 @@ class QuestionRating(BaseModel):
     question_id: int
     rating: str  # easy, medium, hard
 
+class SessionRatingItem(BaseModel):
+    question_id: int
+    rating: str  # easy, medium, hard
+
+class ReviewResponse(BaseModel):
+    question_id: int
+    ease: float
+    interval: float  # дни
+    repetitions: int
+    lapses: int
+    next_due: datetime
+    last_reviewed: Optional[datetime] = None
+
+# Модели для учёта времени
+class TimeRecord(BaseModel):
+    day: date
+    act_id: int
+    time: int = 0  # секунды
+    count: float = 0
+
+class TimeValues(BaseModel):
+    time: int = 0
+    count: float = 0
+
+class TimeResponse(BaseModel):
+    day: date
+    act_id: int
+    time: int
+    count: float
+
+class TimerStart(BaseModel):
+    act_id: int
+
+class TimerResponse(BaseModel):
+    id: int
+    act_id: int
+    state: str  # counting, paused, stopped
+    elapsed: int  # секунды
+
+class TimeReportRow(BaseModel):
+    period_start: date
+    act_id: int
+    time: int
+    count: float
+
+def tag_to_dict(tag):
+    return {"slug": tag.slug, "title": tag.title}
+
+def question_to_dict(question):
+    return {
+        "id": question.id,
+        "q": question.q,
+        "a": question.a,
+        "difficulty": question.difficulty,
+        "tags": [tag_to_dict(tag) for tag in question.tags]
+    }
+
+def parse_question_fields(fields):
+    """?fields=q,tags -> кортеж полей из QUESTION_FIELDS (id включается всегда)"""
+    if fields is None:
+        return QUESTION_FIELDS
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(QUESTION_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in QUESTION_FIELDS if field in requested or field == "id")
+
+def invalidate_questions_cache(question_ids=()):
+    """Сбросить списки вопросов, счётчики фасетов и записи затронутых вопросов"""
+    catalog_cache.invalidate("questions")
+    catalog_cache.invalidate("facets")
+    for question_id in question_ids:
+        catalog_cache.invalidate("question", question_id)
+
+def invalidate_tags_cache(slugs, question_ids=()):
+    """Сбросить список тэгов, записи тэгов и вопросы, в которых они встречаются"""
+    catalog_cache.invalidate("tags")
+    catalog_cache.invalidate("facets")
+    for slug in slugs:
+        catalog_cache.invalidate("tag", slug)
+    if question_ids:
+        invalidate_questions_cache(question_ids)
+
+def question_ids_with_tags(db, slugs):
+    return [question_id for (question_id,) in db.query(question_tags.c.question_id).filter(
+        question_tags.c.tag_slug.in_(slugs)
+    ).distinct()]
+
+
 @app.get("/")
 async def root():
     return {"message": "Hello, World!"}
 
 
 @app.get("/db-test/")
-async def db_test(db: Session = Depends(get_db)):
+def db_test(db: Session = Depends(get_db)):
     return {"message": "Database connected successfully"}
 
 
 @app.get("/acts/")
-async def get_acts(db: Session = Depends(get_db)):
-    acts = db.query(Act).all()
-    return acts
+def get_acts(request: Request, response: Response, db: Session = Depends(get_read_db)):
+    etag, not_modified = check_etag(request, response, db, ACTS_TABLES)
+    if not_modified:
+        return not_modified
+    return json_response(select_acts(db), etag)
 
 @app.post("/acts/", response_model=ActItemResponse)
-async def create_act_item(act: ActItemCreate, db: Session = Depends(get_db)):
-    db_item = Act(title=act.title, start_date=act.start_date, end_date=act.end_date, parent_id=act.parent_id)
+def create_act_item(act: ActItemCreate, db: Session = Depends(get_db)):
+    if act.parent_id is not None and db.query(Act.id).filter(Act.id == act.parent_id).first() is None:
+        raise HTTPException(status_code=404, detail="Parent act not found")
+    db_item = Act(title=act.title, start_date=act.start_date, end_date=act.end_date, parent_id=act.parent_id,
+                  hidden=act.hidden, sort_order=act.sort_order)
     db.add(db_item)
+    db.flush()
+    add_to_closure(db, db_item.id, act.parent_id)
+    db.commit()
+    db.refresh(db_item)
+    return db_item
+
+
+@app.post("/acts/batch", response_model=BatchResponse)
+def create_acts_batch(items: List[ActItemCreate], db: Session = Depends(get_db)):
+    """Создать несколько занятий одной транзакцией"""
+    results = bulk.create_acts(db, items)
+    db.commit()
+    return {"results": results}
+
+@app.put("/acts/batch", response_model=BatchResponse)
+def update_acts_batch(items: List[ActUpdateItem], db: Session = Depends(get_db)):
+    """Обновить несколько занятий одной транзакцией"""
+    results = bulk.update_acts(db, items)
+    db.commit()
+    return {"results": results}
+
+@app.delete("/acts/batch", response_model=BatchResponse)
+def delete_acts_batch(ids: List[int] = Body(...), db: Session = Depends(get_db)):
+    """Удалить несколько занятий (без потомков и связанных записей)"""
+    results = bulk.delete_acts(db, ids)
+    db.commit()
+    return {"results": results}
+
+
+@app.get("/acts/tree", response_model=list[ActTreeNode])
+def get_acts_tree(request: Request, response: Response, root_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    """Иерархия занятий (или поддерево root_id), собранная из одного запроса"""
+    etag, not_modified = check_etag(request, response, db, ACTS_TABLES)
+    if not_modified:
+        return not_modified
+    if root_id is not None and db.query(Act.id).filter(Act.id == root_id).first() is None:
+        raise HTTPException(status_code=404, detail="Act not found")
+    return json_response(load_tree(db, root_id), etag)
+
+
+@app.get("/acts/{act_id}/descendants")
+def get_act_descendants(act_id: int, db: Session = Depends(get_read_db)):
+    """id всех потомков занятия по таблице замыкания"""
+    ids = descendant_ids(db, act_id, include_self=False)
+    if not ids and db.query(Act.id).filter(Act.id == act_id).first() is None:
+        raise HTTPException(status_code=404, detail="Act not found")
+    return ids
+
+
+@app.put("/acts/{act_id}", response_model=ActItemResponse)
+def update_act_item(act_id: int, act: ActItemCreate, db: Session = Depends(get_db)):
+    db_item = db.query(Act).filter(Act.id == act_id).first()
+    if db_item is None:
+        raise HTTPException(status_code=404, detail="Act not found")
+
+    if act.parent_id != db_item.parent_id:
+        if act.parent_id is not None:
+            if db.query(Act.id).filter(Act.id == act.parent_id).first() is None:
+                raise HTTPException(status_code=404, detail="Parent act not found")
+            if is_descendant(db, act.parent_id, act_id):
+                raise HTTPException(status_code=400, detail="Act cannot be moved under its own descendant")
+        move_in_closure(db, act_id, act.parent_id)
+        db_item.parent_id = act.parent_id
+
+    db_item.title = act.title
+    db_item.start_date = act.start_date
+    db_item.end_date = act.end_date
+    db_item.hidden = act.hidden
+    db_item.sort_order = act.sort_order
     db.commit()
     db.refresh(db_item)
     return db_item
 
 
 @app.get("/acts/{act_id}")
-async def get_act(act_id: int, db: Session = Depends(get_db)):
+def get_act(act_id: int, db: Session = Depends(get_read_db)):
     act = db.query(Act).filter(Act.id == act_id).first()
     if act is None:
         raise HTTPException(status_code=404, detail="Act not found")
@@ -150,20 +440,137 @@ async def get_act(act_id: int, db: Session = Depends(get_db)):
 
 
 
+@app.post("/api/v1/times/", response_model=TimeResponse)
+async def add_time(record: TimeRecord):
+    """Прибавить время и количество к дню занятия (через очередь записи)"""
+    def write(db: Session):
+        if db.query(Act.id).filter(Act.id == record.act_id).first() is None:
+            raise HTTPException(status_code=404, detail="Act not found")
+        record_time(db, record.day, record.act_id, record.time, record.count)
+        return select_time(db, record.day, record.act_id)
+    return await write_queue.run(write)
+
+@app.put("/api/v1/times/{day}/{act_id}", response_model=TimeResponse)
+async def update_time(day: date, act_id: int, values: TimeValues):
+    """Установить время и количество за день занятия (через очередь записи)"""
+    def write(db: Session):
+        if db.query(Act.id).filter(Act.id == act_id).first() is None:
+            raise HTTPException(status_code=404, detail="Act not found")
+        set_time(db, day, act_id, values.time, values.count)
+        return select_time(db, day, act_id)
+    return await write_queue.run(write)
+
+@app.get("/api/v1/times/report", response_model=list[TimeReportRow])
+def get_time_report(
+    start: date,
+    end: date,
+    period: Literal["day", "week", "month"] = "day",
+    act_id: Optional[int] = None,
+    rollup: bool = True,
+    db: Session = Depends(get_read_db)
+):
+    """Суммы времени по дням, неделям или месяцам с учётом вложенных занятий"""
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return time_report(db, start, end, period=period, act_id=act_id, rollup=rollup)
+
+
+
+@app.get("/api/v1/timers/", response_model=list[TimerResponse])
+def get_timers():
+    """Незавершённые таймеры"""
+    return timer_service.list()
+
+@app.post("/api/v1/timers/", response_model=TimerResponse)
+def start_timer(timer: TimerStart, db: Session = Depends(get_db)):
+    """Запустить новый таймер для занятия"""
+    if db.query(Act.id).filter(Act.id == timer.act_id).first() is None:
+        raise HTTPException(status_code=404, detail="Act not found")
+    result = timer_service.start(db, timer.act_id)
+    broadcaster.publish("timers", result)
+    return result
+
+@app.get("/api/v1/timers/{timer_id}", response_model=TimerResponse)
+def get_timer(timer_id: int):
+    try:
+        return timer_service.get(timer_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Timer not found")
+
+@app.post("/api/v1/timers/{timer_id}/{action}", response_model=TimerResponse)
+def change_timer(timer_id: int, action: Literal["pause", "resume", "stop"], db: Session = Depends(get_db)):
+    """Поставить таймер на паузу, продолжить или остановить"""
+    handler = getattr(timer_service, action)
+    try:
+        result = handler(db, timer_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Timer not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    broadcaster.publish("timers", result)
+    return result
+
+
+@app.get("/api/v1/events")
+async def events(request: Request, topic: List[str] = Query(["timers"])):
+    """Server-Sent Events: изменения таймеров ("timers") и оценки в сессиях ("session:<id>")"""
+    subscription = broadcaster.subscribe(topic)
+    return StreamingResponse(
+        broadcaster.stream(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+
 @app.get('/api/v1/tags/', response_model=list[TagSchema])
-async def get_tags(db: Session = Depends(get_db)):
-    tags = db.query(Tag).all()
-    return tags
+def get_tags(request: Request, response: Response, db: Session = Depends(get_read_db)):
+    etag, not_modified = check_etag(request, response, db, TAGS_TABLES)
+    if not_modified:
+        return not_modified
+    return json_response(catalog_cache.get_or_load(("tags", etag), lambda: select_tags(db)), etag)
+
+@app.post('/api/v1/tags/batch', response_model=BatchResponse)
+def create_tags_batch(items: List[TagSchema], db: Session = Depends(get_db)):
+    """Создать несколько тэгов одной транзакцией"""
+    results = bulk.create_tags(db, items)
+    db.commit()
+    invalidate_tags_cache([item.slug for item in items])
+    return {"results": results}
+
+@app.put('/api/v1/tags/batch', response_model=BatchResponse)
+def update_tags_batch(items: List[TagSchema], db: Session = Depends(get_db)):
+    """Переименовать несколько тэгов одной транзакцией"""
+    slugs = [item.slug for item in items]
+    question_ids = question_ids_with_tags(db, slugs)
+    results = bulk.update_tags(db, items)
+    db.commit()
+    invalidate_tags_cache(slugs, question_ids)
+    return {"results": results}
+
+@app.delete('/api/v1/tags/batch', response_model=BatchResponse)
+def delete_tags_batch(slugs: List[str] = Body(...), db: Session = Depends(get_db)):
+    """Удалить несколько тэгов одной транзакцией"""
+    question_ids = question_ids_with_tags(db, slugs)
+    results = bulk.delete_tags(db, slugs)
+    db.commit()
+    invalidate_tags_cache(slugs, question_ids)
+    return {"results": results}
 
 @app.get('/api/v1/tags/{tag_slug}', response_model=TagSchema)
-async def get_tag(tag_slug: str, db: Session = Depends(get_db)):
-    tag = db.query(Tag).filter(Tag.slug == tag_slug).first()
-    if tag is None:
-        raise HTTPException(status_code=404, detail='Tag not found')
+def get_tag(tag_slug: str, db: Session = Depends(get_read_db)):
+    key = ("tag", tag_slug, table_etag(db, TAGS_TABLES))
+    found, tag = catalog_cache.get(key)
+    if not found:
+        tag = db.query(Tag).filter(Tag.slug == tag_slug).first()
+        if tag is None:
+            raise HTTPException(status_code=404, detail='Tag not found')
+        tag = tag_to_dict(tag)
+        catalog_cache.set(key, tag)
     return tag
 
 @app.post('/api/v1/tags/', response_model=TagSchema)
-async def crate_tag(tag: TagSchema, db: Session = Depends(get_db)):
+def crate_tag(tag: TagSchema, db: Session = Depends(get_db)):
     existing_tag = db.query(Tag).filter(Tag.slug == tag.slug).first()
     if existing_tag:
         raise HTTPException(status_code=400, detail='Такой тэг уже существует')
@@ -171,29 +578,139 @@ async def crate_tag(tag: TagSchema, db: Session = Depends(get_db)):
     db_item = Tag(slug=tag.slug, title=tag.title)
     db.add(db_item)
     db.commit()
+    invalidate_tags_cache([tag.slug])
     db.refresh(db_item)
     return db_item
 
 
 @app.delete("/api/v1/tags/{tag_slug}")
-async def delete_tag(tag_slug: str, db: Session = Depends(get_db)):
+def delete_tag(tag_slug: str, db: Session = Depends(get_db)):
     db_tag = db.query(Tag).filter(Tag.slug == tag_slug).first()
     if db_tag is None:
         return HTTPException(status_code=404, detail='Такого тэга нет')
 
+    question_ids = question_ids_with_tags(db, [tag_slug])
     db.delete(db_tag)
     db.commit()
+    invalidate_tags_cache([tag_slug], question_ids)
     return {'message': 'Тэг успешно удалён'}
 
 
 
 @app.get('/api/v1/questions/', response_model=list[QuestionResponse])
-async def get_questions(db: Session = Depends(get_db)):
-    qs = db.query(Question).all()
-    return qs
+def get_questions(
+    request: Request,
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    tag: List[str] = Query([]),
+    exclude_tag: List[str] = Query([]),
+    difficulty: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Поля через запятую: id, q, a, difficulty, tags"),
+    db: Session = Depends(get_read_db)
+):
+    """Список вопросов с keyset-пагинацией по id и фильтрами.
+
+    Следующая страница запрашивается с after_id = id последнего вопроса.
+    Теги подгружаются одним запросом на страницу. Спискам обычно не нужен
+    ответ: с fields=id,q,tags столбец a не читается из базы, а сам ответ
+    берётся по одному через /api/v1/questions/{id}/answer.
+    """
+    fields = parse_question_fields(fields)
+    etag, not_modified = check_etag(request, response, db, QUESTIONS_TABLES)
+    if not_modified:
+        return not_modified
+
+    key = ("questions", after_id, limit, tuple(tag), tuple(exclude_tag), difficulty, fields, etag)
+    questions = catalog_cache.get_or_load(
+        key, lambda: select_questions(db, after_id, limit, tag, exclude_tag, difficulty, fields)
+    )
+    return json_response(questions, etag)
+
+@app.get('/api/v1/questions/search', response_model=list[QuestionSearchResult])
+def search_questions_endpoint(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db)
+):
+    """Полнотекстовый поиск по вопросам и ответам (FTS5, ранжирование bm25)"""
+    hits = search_questions(db, q, limit=limit, offset=offset)
+    if not hits:
+        return []
+
+    return json_response(join_search_hits(db, hits))
+
+@app.get('/api/v1/questions/facets', response_model=QuestionFacets)
+def get_question_facets(
+    request: Request,
+    response: Response,
+    tag: List[str] = Query([]),
+    difficulty: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Число вопросов по тэгам (с учётом difficulty) и по сложности (с учётом tag)"""
+    etag, not_modified = check_etag(request, response, db, QUESTIONS_TABLES)
+    if not_modified:
+        return not_modified
+    facets = catalog_cache.get_or_load(
+        ("facets", tuple(sorted(tag)), difficulty, etag), lambda: question_facets(db, tag, difficulty)
+    )
+    return json_response(facets, etag)
+
+@app.post("/api/v1/questions/batch", response_model=BatchResponse)
+def create_questions_batch(items: List[QuestionCreate], db: Session = Depends(get_db)):
+    """Создать несколько вопросов одной транзакцией"""
+    results = bulk.create_questions(db, items)
+    db.commit()
+    invalidate_questions_cache()
+    return {"results": results}
+
+@app.put("/api/v1/questions/batch", response_model=BatchResponse)
+def update_questions_batch(items: List[QuestionUpdateItem], db: Session = Depends(get_db)):
+    """Обновить несколько вопросов одной транзакцией"""
+    results = bulk.update_questions(db, items)
+    db.commit()
+    invalidate_questions_cache([item.id for item in items])
+    return {"results": results}
+
+@app.delete("/api/v1/questions/batch", response_model=BatchResponse)
+def delete_questions_batch(ids: List[int] = Body(...), db: Session = Depends(get_db)):
+    """Удалить несколько вопросов одной транзакцией"""
+    results = bulk.delete_questions(db, ids)
+    db.commit()
+    invalidate_questions_cache(ids)
+    return {"results": results}
+
+@app.get("/api/v1/questions/{question_id}", response_model=QuestionResponse)
+def get_question(question_id: int, db: Session = Depends(get_read_db)):
+    key = ("question", question_id, table_etag(db, QUESTIONS_TABLES))
+    found, question = catalog_cache.get(key)
+    if not found:
+        question = db.query(Question).options(undefer(Question.a), selectinload(Question.tags)).filter(
+            Question.id == question_id
+        ).first()
+        if question is None:
+            raise HTTPException(status_code=404, detail="Question not found")
+        question = question_to_dict(question)
+        catalog_cache.set(key, question)
+    return question
+
+@app.get("/api/v1/questions/{question_id}/answer", response_model=QuestionAnswer)
+def get_question_answer(question_id: int, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    """Ответ на один вопрос - для списков, загруженных без поля a"""
+    etag, not_modified = check_etag(request, response, db, QUESTIONS_TABLES)
+    if not_modified:
+        return not_modified
+    answer = catalog_cache.get_or_load(
+        ("question", question_id, "answer", etag), lambda: select_question_answer(db, question_id)
+    )
+    if answer is None:
+        raise HTTPException(status_code=404, detail="Question not found")
+    return json_response(answer, etag)
 
 @app.post("/api/v1/questions/", response_model=QuestionResponse)
-async def create_question(question: QuestionCreate, db: Session = Depends(get_db)):
+def create_question(question: QuestionCreate, db: Session = Depends(get_db)):
     db_question = Question(
         q=question.q,
         a=question.a,
@@ -203,19 +720,17 @@ async def create_question(question: QuestionCreate, db: Session = Depends(get_db
     db.flush()  # Получаем ID
 
     if question.tag_slugs:
-        for tag_slug in question.tag_slugs:
-            tag = db.query(Tag).filter(Tag.slug == tag_slug).first()
-            if tag:
-                db_question.tags.append(tag)
+        db_question.tags = db.query(Tag).filter(Tag.slug.in_(question.tag_slugs)).all()
 
     db.commit()
+    invalidate_questions_cache()
     db.refresh(db_question)
     return db_question
 
 
 
 @app.put("/api/v1/questions/{question_id}", response_model=QuestionResponse)
-async def update_question(question_id: int, question: QuestionCreate, db: Session = Depends(get_db)):
+def update_question(question_id: int, question: QuestionCreate, db: Session = Depends(get_db)):
     try:
         # Находим вопрос
         db_question = db.query(Question).filter(Question.id == question_id).first()
@@ -227,26 +742,14 @@ async def update_question(question_id: int, question: QuestionCreate, db: Sessio
         db_question.a = question.a
         db_question.difficulty = question.difficulty
         
-        # Очищаем старые теги
-        db_question.tags.clear()
-        
-        # Добавляем новые теги
-        if question.tag_slugs:
-            for tag_slug in question.tag_slugs:
-                tag = db.query(Tag).filter(Tag.slug == tag_slug).first()
-                if tag:
-                    db_question.tags.append(tag)
+        # Заменяем теги (все slug'и одним запросом)
+        db_question.tags = db.query(Tag).filter(Tag.slug.in_(question.tag_slugs)).all() if question.tag_slugs else []
         
         db.commit()
+        invalidate_questions_cache([question_id])
         db.refresh(db_question)
         
-        return {
-            "id": db_question.id,
-            "q": db_question.q,
-            "a": db_question.a,
-            "difficulty": db_question.difficulty,
-            "tags": [{"slug": tag.slug, "title": tag.title} for tag in db_question.tags]
-        }
+        return question_to_dict(db_question)
         
     except Exception as e:
         db.rollback()
@@ -255,13 +758,15 @@ async def update_question(question_id: int, question: QuestionCreate, db: Sessio
 
 
 @app.delete("/api/v1/questions/{id}")
-async def delete_question(id: int, db: Session = Depends(get_db)):
+def delete_question(id: int, db: Session = Depends(get_db)):
     q = db.query(Question).filter(Question.id == id).first()
     if q is None:
         return HTTPException(status_code=404, detail='Такого вопроса нет')
 
+    db.query(QuestionReview).filter(QuestionReview.question_id == id).delete()
     db.delete(q)
     db.commit()
+    invalidate_questions_cache([id])
     return {'message': 'Вопрос успешно удалён'}
 
 
@@ -269,8 +774,25 @@ async def delete_question(id: int, db: Session = Depends(get_db)):
 
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Метрики в формате Prometheus: задержки, SQL на запрос, признаки N+1"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/v1/cache/stats")
+def get_cache_stats():
+    """Счётчики кэша каталога: попадания, промахи, вытеснения"""
+    return catalog_cache.stats()
+
+@app.get("/api/v1/writer/stats")
+def get_writer_stats():
+    """Счётчики очереди записи: пачки (коммиты), выполненные и упавшие задания"""
+    return write_queue.stats()
+
+
+
 @app.post("/test-items/", response_model=TestItemResponse)
-async def create_test_item(item: TestItemCreate, db: Session = Depends(get_db)):
+def create_test_item(item: TestItemCreate, db: Session = Depends(get_db)):
     db_item = TestItem(name=item.name, description=item.description)
     db.add(db_item)
     db.commit()
@@ -279,13 +801,12 @@ async def create_test_item(item: TestItemCreate, db: Session = Depends(get_db)):
 
 # Эндпоинт для получения всех записей
 @app.get("/test-items/")
-async def get_test_items(db: Session = Depends(get_db)):
-    items = db.query(TestItem).all()
-    return items
+def get_test_items(db: Session = Depends(get_read_db)):
+    return json_response(select_test_items(db))
 
 # Эндпоинт для получения записи по ID
 @app.get("/test-items/{item_id}")
-async def get_test_item(item_id: int, db: Session = Depends(get_db)):
+def get_test_item(item_id: int, db: Session = Depends(get_read_db)):
     item = db.query(TestItem).filter(TestItem.id == item_id).first()
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -294,18 +815,31 @@ async def get_test_item(item_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/db/inspect")
-async def inspect_db(db: Session = Depends(get_db)):
-    # Показать все таблицы
-    tables = db.execute(text("SELECT name FROM sqlite_master WHERE type='table';")).fetchall()
-    
-
-    result = {}
-    for table in tables:
-        table_name = table[0]
-        data = db.execute(text(f"SELECT * FROM {table_name};")).fetchall()
-        result[table_name] = [dict(row._mapping) for row in data]
-    
-    return result
+def inspect_db(
+    table: List[str] = Query([]),
+    after_table: Optional[str] = None,
+    after_rowid: Optional[int] = None,
+    chunk_size: int = Query(CHUNK_SIZE, ge=1, le=10000),
+    db: Session = Depends(get_read_db)
+):
+    """Потоковая выгрузка содержимого таблиц в формате NDJSON.
+
+    table - ограничить выгрузку указанными таблицами,
+    after_table/after_rowid - продолжить с места, где выгрузка прервалась.
+    """
+    tables = list_tables(db)
+    if table:
+        unknown = [name for name in table if name not in tables]
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Unknown tables: {', '.join(unknown)}")
+        tables = [name for name in tables if name in table]
+    if after_table is not None and after_table not in tables:
+        raise HTTPException(status_code=404, detail=f"Unknown table: {after_table}")
+
+    return StreamingResponse(
+        iter_export(tables, after_table=after_table, after_rowid=after_rowid, chunk_size=chunk_size),
+        media_type="application/x-ndjson"
+    )
 
 
 @app.get("/{id:str}/")
@@ -319,25 +853,26 @@ async def activity(slug: str):
 
 # API для учебных сессий
 @app.post("/api/v1/study-sessions/", response_model=StudySessionResponse)
-async def create_study_session(session: StudySessionCreate, db: Session = Depends(get_db)):
+def create_study_session(session: StudySessionCreate, db: Session = Depends(get_db)):
     """Создать новую учебную сессию"""
     db_session = StudySession(
         name=session.name,
         description=session.description
     )
     db.add(db_session)
+    db.flush()
+    db.add(SessionStats(session_id=db_session.id))
     db.commit()
     db.refresh(db_session)
     return db_session
 
 @app.get("/api/v1/study-sessions/", response_model=List[StudySessionResponse])
-async def get_study_sessions(db: Session = Depends(get_db)):
+def get_study_sessions(db: Session = Depends(get_read_db)):
     """Получить все учебные сессии"""
-    sessions = db.query(StudySession).all()
-    return sessions
+    return json_response(select_study_sessions(db))
 
 @app.get("/api/v1/study-sessions/{session_id}", response_model=StudySessionResponse)
-async def get_study_session(session_id: int, db: Session = Depends(get_db)):
+def get_study_session(session_id: int, db: Session = Depends(get_read_db)):
     """Получить учебную сессию по ID"""
     session = db.query(StudySession).filter(StudySession.id == session_id).first()
     if not session:
@@ -345,12 +880,13 @@ async def get_study_session(session_id: int, db: Session = Depends(get_db)):
     return session
 
 @app.delete("/api/v1/study-sessions/{session_id}")
-async def delete_study_session(session_id: int, db: Session = Depends(get_db)):
+def delete_study_session(session_id: int, db: Session = Depends(get_db)):
     """Удалить учебную сессию"""
     session = db.query(StudySession).filter(StudySession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Study session not found")
     db.query(SessionQuestion).filter(SessionQuestion.session_id == session_id).delete()
+    db.query(SessionStats).filter(SessionStats.session_id == session_id).delete()
     db.commit()
     db.delete(session)
     db.commit()
@@ -358,7 +894,7 @@ async def delete_study_session(session_id: int, db: Session = Depends(get_db)):
 
 
 @app.post("/api/v1/study-sessions/{session_id}/end")
-async def end_study_session(session_id: int, db: Session = Depends(get_db)):
+def end_study_session(session_id: int, db: Session = Depends(get_db)):
     """Завершить учебную сессию"""
     session = db.query(StudySession).filter(StudySession.id == session_id).first()
     if not session:
@@ -370,109 +906,146 @@ async def end_study_session(session_id: int, db: Session = Depends(get_db)):
     return {"message": "Study session ended"}
 
 @app.get("/api/v1/study-sessions/{session_id}/next-question")
-async def get_next_question(session_id: int, db: Session = Depends(get_db)):
-    """Получить следующий вопрос для сессии"""
-    session = db.query(StudySession).filter(StudySession.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Study session not found")
-    
-    # Находим вопросы, которые еще не были показаны или показаны мало раз
-    # Исключаем только те вопросы, которые помечены как "easy" (легкие)
-    easy_question_ids = db.query(SessionQuestion.question_id).filter(
-        SessionQuestion.session_id == session_id,
-        SessionQuestion.status == 'easy'
-    ).subquery()
-    
-    available_questions = db.query(Question).filter(
-        ~Question.id.in_(easy_question_ids)
-    ).all()
-    
-    if not available_questions:
-        return {"message": "No more questions available"}
-    
-    # Выбираем случайный вопрос
-    import random
-    selected_question = random.choice(available_questions)
-    
-    # Добавляем или обновляем запись в сессии
-    session_question = db.query(SessionQuestion).filter(
-        SessionQuestion.session_id == session_id,
-        SessionQuestion.question_id == selected_question.id
-    ).first()
-    
-    if not session_question:
-        session_question = SessionQuestion(
-            session_id=session_id,
-            question_id=selected_question.id,
-            times_shown=1,
-            last_shown=datetime.now()
+async def get_next_question(session_id: int):
+    """Получить следующий вопрос для сессии (показ записывается через очередь записи)"""
+    def write(db: Session):
+        ensure_session_exists(db, session_id)
+        # Выбираем вопрос по расписанию повторений, исключая помеченные как "easy" (легкие)
+        question_id = pick_question_id(db, session_id)
+        if question_id is None:
+            return {"message": "No more questions available"}
+        return issue_questions(db, session_id, [question_id])[0]
+    return await write_queue.run(write)
+
+@app.get("/api/v1/study-sessions/{session_id}/next-questions")
+def get_next_questions(
+    session_id: int,
+    n: int = Query(10, ge=1, le=MAX_PREFETCH),
+    exclude: List[int] = Query([]),
+    db: Session = Depends(get_read_db)
+):
+    """Пачка следующих вопросов без повторов, для предзагрузки на клиенте.
+
+    exclude - вопросы, которые уже лежат в очереди клиента и ещё не
+    оценены. Выдача ничего не записывает: показ отмечается, когда клиент
+    действительно выводит карточку (POST .../shows), иначе предзагруженные,
+    но не увиденные вопросы попадали бы в статистику сессии.
+    """
+    ensure_session_exists(db, session_id)
+    question_ids = pick_question_ids(db, session_id, n, exclude_ids=exclude)
+    session_questions = {
+        session_question.question_id: session_question
+        for session_question in db.query(SessionQuestion).filter(
+            SessionQuestion.session_id == session_id,
+            SessionQuestion.question_id.in_(question_ids)
         )
-        db.add(session_question)
-    else:
-        session_question.times_shown += 1
-        session_question.last_shown = datetime.now()
-    
-    db.commit()
-    db.refresh(session_question)
-    
-    # Преобразуем вопрос в словарь для правильной сериализации
-    question_data = {
-        "id": selected_question.id,
-        "q": selected_question.q,
-        "a": selected_question.a,
-        "difficulty": selected_question.difficulty,
-        "tags": [{"slug": tag.slug, "title": tag.title} for tag in selected_question.tags]
-    }
-    
-    return {
-        "question": question_data,
-        "session_question_id": session_question.id,
-        "times_shown": session_question.times_shown
-    }
+    } if question_ids else {}
+    return {"questions": question_cards(db, question_ids, session_questions)}
+
+@app.post("/api/v1/study-sessions/{session_id}/shows", response_model=BatchResponse)
+async def record_question_shows(session_id: int, question_ids: List[int]):
+    """Пачка показов вопросов из next-questions, в порядке вывода на клиенте.
+
+    Клиент отправляет показы перед оценками тех же вопросов: оценка
+    принимается только для вопроса, показанного в сессии.
+    """
+    def write(db: Session):
+        ensure_session_exists(db, session_id)
+        return bulk.record_shows(db, session_id, question_ids)
+    return {"results": await write_queue.run(write)}
+
+def ensure_session_exists(db: Session, session_id: int):
+    if db.query(StudySession.id).filter(StudySession.id == session_id).first() is None:
+        raise HTTPException(status_code=404, detail="Study session not found")
+
+def issue_questions(db: Session, session_id: int, question_ids):
+    """Отметить показ вопросов и собрать карточки для клиента (без коммита)"""
+    session_questions = register_shows(db, session_id, question_ids)
+    db.flush()
+    return question_cards(db, question_ids, session_questions)
+
+def question_cards(db: Session, question_ids, session_questions):
+    """Карточки вопросов; у ещё не показанных в сессии нет session_question_id"""
+    questions = select_questions_by_id(db, question_ids)
+    cards = []
+    for question_id in question_ids:
+        session_question = session_questions.get(question_id)
+        cards.append({
+            "question": questions[question_id],
+            "session_question_id": session_question.id if session_question else None,
+            "times_shown": session_question.times_shown if session_question else 0
+        })
+    return cards
 
 @app.post("/api/v1/study-sessions/{session_id}/rate-question")
-async def rate_question(session_id: int, rating: QuestionRating, db: Session = Depends(get_db)):
-    """Оценить вопрос в сессии"""
-    session_question = db.query(SessionQuestion).filter(
-        SessionQuestion.session_id == session_id,
-        SessionQuestion.question_id == rating.question_id
-    ).first()
-    
-    if not session_question:
-        raise HTTPException(status_code=404, detail="Question not found in session")
-    
-    session_question.status = rating.rating
-    db.commit()
-    
-    return {"message": f"Question rated as {rating.rating}"}
+async def rate_question(session_id: int, rating: QuestionRating):
+    """Оценить вопрос в сессии (через очередь записи)"""
+    def write(db: Session):
+        session_question = db.query(SessionQuestion).filter(
+            SessionQuestion.session_id == session_id,
+            SessionQuestion.question_id == rating.question_id
+        ).first()
+        if not session_question:
+            raise HTTPException(status_code=404, detail="Question not found in session")
+
+        old_status = session_question.status
+        session_question.status = rating.rating
+        bump_session_stats(db, session_id, old_status=old_status, new_status=rating.rating)
+        review = review_question(db, rating.question_id, rating.rating)
+
+        result = {"message": f"Question rated as {rating.rating}"}
+        if review is not None:
+            result["review"] = review
+        return result, get_session_stats(db, session_id)
+
+    result, stats = await write_queue.run(write)
+    broadcaster.publish(f"session:{session_id}", {
+        "type": "rating",
+        "session_id": session_id,
+        "question_id": rating.question_id,
+        "rating": rating.rating,
+        "statistics": stats
+    })
+    return result
+
+@app.post("/api/v1/study-sessions/{session_id}/ratings", response_model=BatchResponse)
+async def rate_questions_batch(session_id: int, items: List[SessionRatingItem]):
+    """Пачка оценок одной транзакцией - клиент копит оценки и отправляет их разом"""
+    def write(db: Session):
+        ensure_session_exists(db, session_id)
+        results = bulk.rate_questions(db, session_id, items)
+        stats = get_session_stats(db, session_id) if any(result["ok"] for result in results) else None
+        return results, stats
+
+    results, stats = await write_queue.run(write)
+    rated = [item for item, result in zip(items, results) if result["ok"]]
+    if rated:
+        broadcaster.publish(f"session:{session_id}", {
+            "type": "ratings",
+            "session_id": session_id,
+            "ratings": [{"question_id": item.question_id, "rating": item.rating} for item in rated],
+            "statistics": stats
+        })
+    return {"results": results}
 
 @app.get("/api/v1/study-sessions/{session_id}/statistics")
-async def get_session_statistics(session_id: int, db: Session = Depends(get_db)):
+def get_session_statistics(session_id: int, db: Session = Depends(get_read_db)):
     """Получить статистику сессии"""
-    session = db.query(StudySession).filter(StudySession.id == session_id).first()
-    if not session:
+    sessions = select_study_sessions(db, session_id)
+    if not sessions:
         raise HTTPException(status_code=404, detail="Study session not found")
     
-    session_questions = db.query(SessionQuestion).filter(
-        SessionQuestion.session_id == session_id
-    ).all()
+    stats = read_session_stats(db, session_id)
+    total_questions = stats["total_questions"]
+    total_shows = stats["total_shows"]
     
-    total_questions = len(session_questions)
-    easy_questions = len([sq for sq in session_questions if sq.status == 'easy'])
-    medium_questions = len([sq for sq in session_questions if sq.status == 'medium'])
-    hard_questions = len([sq for sq in session_questions if sq.status == 'hard'])
-    pending_questions = len([sq for sq in session_questions if sq.status == 'pending'])
-    
-    total_shows = sum(sq.times_shown for sq in session_questions)
-    
-    return {
-        "session": session,
-        "total_questions": total_questions,
-        "easy_questions": easy_questions,
-        "medium_questions": medium_questions,
-        "hard_questions": hard_questions,
-        "pending_questions": pending_questions,
-        "total_shows": total_shows,
+    return json_response({
+        "session": sessions[0],
+        **stats,
         "average_shows": total_shows / total_questions if total_questions > 0 else 0
-    }
+    })
 
+@app.get("/api/v1/reviews/due", response_model=List[ReviewResponse])
+def get_due_reviews(limit: int = Query(50, ge=1, le=1000), db: Session = Depends(get_read_db)):
+    """Вопросы, которые пора повторить, самые просроченные первыми"""
+    return [review_to_dict(review) for review in due_reviews(db, limit=limit)]
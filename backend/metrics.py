@@ -0,0 +1,188 @@
+"""Метрики запросов: задержки по маршрутам и SQL-запросы на запрос.
+
+MetricsMiddleware замеряет каждый HTTP-запрос и кладёт в contextvar
+счётчик SQL. Обработчики в пуле потоков получают копию контекста, поэтому
+хуки before/after_cursor_execute на Engine видят счётчик своего запроса.
+Если запрос выполнил один и тот же SQL больше N_PLUS_ONE_THRESHOLD раз,
+это похоже на N+1: растёт счётчик и пишется предупреждение в лог.
+render() отдаёт всё в текстовом формате Prometheus.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Сколько одинаковых SQL-запросов за один HTTP-запрос считать признаком N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 5))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RequestQueries:
+    """SQL, выполненный в рамках одного HTTP-запроса"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+
+current_queries = contextvars.ContextVar("current_queries", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def finish_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["statement_started"].pop()
+    queries = current_queries.get()
+    if queries is not None:
+        queries.count += 1
+        queries.seconds += time.perf_counter() - started
+        queries.statements[statement] += 1
+
+
+@event.listens_for(Engine, "handle_error")
+def drop_statement(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("statement_started"):
+        conn.info["statement_started"].pop()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()  # (method, route, status) -> число
+        self.latency = {}  # (method, route) -> Histogram
+        self.statements = {}  # (method, route) -> Histogram
+        self.sql_seconds = Counter()  # (method, route) -> секунды
+        self.n_plus_one = Counter()  # (method, route) -> число запросов с признаком N+1
+
+    def record(self, method, route, status, seconds, queries):
+        key = (method, route)
+        repeated = [
+            (statement, count) for statement, count in queries.statements.items()
+            if count > N_PLUS_ONE_THRESHOLD
+        ]
+        with self.lock:
+            self.requests[(method, route, status)] += 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.statements.setdefault(key, Histogram(STATEMENT_BUCKETS)).observe(queries.count)
+            self.sql_seconds[key] += queries.seconds
+            if repeated:
+                self.n_plus_one[key] += 1
+        for statement, count in repeated:
+            logger.warning("Possible N+1 in %s %s: %d x %s", method, route, count, " ".join(statement.split()))
+
+    def render(self):
+        """Текстовый формат Prometheus (exposition format 0.0.4)"""
+        lines = []
+        with self.lock:
+            lines.append("# HELP http_requests_total HTTP requests by route and status.")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{labels(method, route, status=status)} {count}")
+
+            render_histograms(lines, "http_request_duration_seconds", "HTTP request latency.", self.latency)
+            render_histograms(lines, "db_statements_per_request", "SQL statements per HTTP request.", self.statements)
+
+            lines.append("# HELP db_statement_seconds_total Time spent in SQL statements.")
+            lines.append("# TYPE db_statement_seconds_total counter")
+            for (method, route), seconds in sorted(self.sql_seconds.items()):
+                lines.append(f"db_statement_seconds_total{labels(method, route)} {seconds:.6f}")
+
+            lines.append(
+                f"# HELP db_n_plus_one_requests_total Requests that ran one statement more than "
+                f"{N_PLUS_ONE_THRESHOLD} times."
+            )
+            lines.append("# TYPE db_n_plus_one_requests_total counter")
+            for (method, route), count in sorted(self.n_plus_one.items()):
+                lines.append(f"db_n_plus_one_requests_total{labels(method, route)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def labels(method, route, **extra):
+    pairs = {"method": method, "route": route, **extra}
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs.items()) + "}"
+
+
+def render_histograms(lines, name, help_text, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route), histogram in sorted(histograms.items()):
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f"{name}_bucket{labels(method, route, le=bound)} {count}")
+        lines.append(f"{name}_bucket{labels(method, route, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{labels(method, route)} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{labels(method, route)} {histogram.count}")
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка, статус и SQL каждого HTTP-запроса.
+
+    Маршрут берётся из шаблона пути (/acts/{act_id}), а не из URL, чтобы
+    число рядов метрик не росло с числом id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_queries.reset(token)
+            route = scope.get("route")
+            metrics.record(
+                scope["method"], getattr(route, "path", UNMATCHED_ROUTE), status,
+                time.perf_counter() - started, queries
+            )
@@ -1,10 +1,18 @@
-from sqlalchemy import Column, Integer, Float, String, Date, DateTime, ForeignKey, Text, Table, Boolean, Enum
+from sqlalchemy import Column, Integer, Float, String, Date, DateTime, ForeignKey, Text, Table, Boolean, Enum, Index, insert_sentinel
 from sqlalchemy.sql import func
 from database import Base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.ext.declarative import declared_attr
 import enum
 
+class TableVersion(Base):
+    """Счётчик изменений таблицы, из него строятся ETag для GET-запросов"""
+    __tablename__ = "table_versions"
+
+    table_name = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+
 class TestItem(Base):
     __tablename__ = "test_items"
     
@@ -29,13 +37,24 @@ class Act(SortableMixin, Base):
     start_date = Column(Date)
     end_date = Column(Date)
     hidden = Column(Boolean, default=False)
-    parent_id = Column(Integer, ForeignKey('acts.id'), nullable=True)
+    parent_id = Column(Integer, ForeignKey('acts.id'), nullable=True, index=True)
+    # Порядковый номер строки в пакетном INSERT: по нему SQLAlchemy сопоставляет
+    # id из RETURNING с параметрами, и пакет уходит одним запросом (bulk.create_acts)
+    _sentinel = insert_sentinel("_sentinel")
     parent = relationship("Act", remote_side=[id], backref="children")
     tasks = relationship("Task", back_populates="act")
     notes = relationship("ActNote", back_populates="act")
     times = relationship("Time", back_populates="act")
     timers = relationship("Timer", back_populates="act") 
 
+class ActClosure(Base):
+    """Таблица замыкания иерархии занятий: все пары предок-потомок"""
+    __tablename__ = "act_closure"
+
+    ancestor_id = Column(Integer, ForeignKey('acts.id'), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey('acts.id'), primary_key=True, index=True)
+    depth = Column(Integer, nullable=False)  # 0 - само занятие
+
 class Plan(SortableMixin, Base):
     __tablename__ = "plans"
 
@@ -56,9 +75,9 @@ class Task(SortableMixin, Base):
     description = Column(Text)
     start_date = Column(DateTime(timezone=True))
     end_date = Column(DateTime(timezone=True))
-    plan_id = Column(Integer, ForeignKey('plans.id'), nullable=True)
+    plan_id = Column(Integer, ForeignKey('plans.id'), nullable=True, index=True)
     plan = relationship("Plan", back_populates="tasks")
-    act_id = Column(Integer, ForeignKey('acts.id'), nullable=True)
+    act_id = Column(Integer, ForeignKey('acts.id'), nullable=True, index=True)
     act = relationship("Act", back_populates="tasks")
 
 class PlanNote(Base):
@@ -67,7 +86,7 @@ class PlanNote(Base):
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     content = Column(Text)
-    plan_id = Column(Integer, ForeignKey('plans.id'), nullable=True)
+    plan_id = Column(Integer, ForeignKey('plans.id'), nullable=True, index=True)
     plan = relationship("Plan", back_populates="notes")
 
 class ActNote(Base):
@@ -76,7 +95,7 @@ class ActNote(Base):
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     content = Column(Text)
-    act_id = Column(Integer, ForeignKey('acts.id'), nullable=True)
+    act_id = Column(Integer, ForeignKey('acts.id'), nullable=True, index=True)
     act = relationship("Act", back_populates="notes")
 
 class Time(Base):
@@ -88,6 +107,29 @@ class Time(Base):
     count = Column(Float, default=0)
     act = relationship("Act", back_populates="times")
 
+    # Первичный ключ начинается с day; для выборок по занятию нужен обратный порядок
+    __table_args__ = (Index('ix_times_act_id_day', 'act_id', 'day'),)
+
+
+class TimeWeekly(Base):
+    """Сводка times по неделям (week_start - понедельник)"""
+    __tablename__ = "times_weekly"
+
+    week_start = Column(Date, primary_key=True)
+    act_id = Column(Integer, ForeignKey('acts.id'), primary_key=True)
+    time = Column(Integer, default=0, nullable=False)
+    count = Column(Float, default=0, nullable=False)
+
+
+class TimeMonthly(Base):
+    """Сводка times по месяцам (month_start - первое число месяца)"""
+    __tablename__ = "times_monthly"
+
+    month_start = Column(Date, primary_key=True)
+    act_id = Column(Integer, ForeignKey('acts.id'), primary_key=True)
+    time = Column(Integer, default=0, nullable=False)
+    count = Column(Float, default=0, nullable=False)
+
 
 class TimerState(enum.Enum):
     STOPPED = "stopped"
@@ -100,7 +142,7 @@ class Timer(Base):
     id = Column(Integer, primary_key=True, index=True)
     time = Column(Integer, default=0)
     start_time = Column(DateTime(timezone=True), server_default=func.now())
-    act_id = Column(Integer, ForeignKey('acts.id'), nullable=True)
+    act_id = Column(Integer, ForeignKey('acts.id'), nullable=True, index=True)
     act = relationship("Act", back_populates="timers")
     state = Column(Enum(TimerState), default=TimerState.STOPPED, nullable=False)
 
@@ -109,7 +151,9 @@ question_tags = Table(
     'question_tags',
     Base.metadata,
     Column('question_id', Integer, ForeignKey('questions.id'), primary_key=True),
-    Column('tag_slug', String, ForeignKey('tags.slug'), primary_key=True)
+    Column('tag_slug', String, ForeignKey('tags.slug'), primary_key=True),
+    # Обратный порядок к первичному ключу: вопросы по тэгу
+    Index('ix_question_tags_tag_slug_question_id', 'tag_slug', 'question_id')
 )
 
 class Tag(Base):
@@ -125,11 +169,15 @@ class Question(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     q = Column(Text, nullable=False)
-    a = Column(Text, nullable=False)
+    a = deferred(Column(Text, nullable=False))  # длинный markdown; грузится только по запросу
     difficulty = Column(String(20), nullable=True)
+    source_key = Column(String, unique=True, index=True, nullable=True)  # категория/номер в q.md
+    content_hash = Column(String(64), nullable=True)  # sha256 от q и a, для повторного импорта
+    _sentinel = insert_sentinel("_sentinel")  # см. Act._sentinel
 
     tags = relationship("Tag", secondary=question_tags, back_populates="questions")
     session_questions = relationship("SessionQuestion", back_populates="question")
+    review = relationship("QuestionReview", uselist=False, back_populates="question")
 
 class StudySession(Base):
     __tablename__ = 'study_sessions'
@@ -143,13 +191,14 @@ class StudySession(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     session_questions = relationship("SessionQuestion", back_populates="session")
+    stats = relationship("SessionStats", uselist=False, back_populates="session")
 
 class SessionQuestion(Base):
     __tablename__ = 'session_questions'
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey('study_sessions.id'), nullable=False)
-    question_id = Column(Integer, ForeignKey('questions.id'), nullable=False)
+    question_id = Column(Integer, ForeignKey('questions.id'), nullable=False, index=True)
     times_shown = Column(Integer, default=0)
     last_shown = Column(DateTime(timezone=True), nullable=True)
     status = Column(String(20), default='pending')  # pending, easy, medium, hard
@@ -158,3 +207,37 @@ class SessionQuestion(Base):
     session = relationship("StudySession", back_populates="session_questions")
     question = relationship("Question", back_populates="session_questions")
 
+    __table_args__ = (
+        Index('ix_session_questions_session_id_question_id', 'session_id', 'question_id', unique=True),
+        Index('ix_session_questions_session_id_status', 'session_id', 'status'),
+    )
+
+
+class SessionStats(Base):
+    """Счётчики сессии, обновляются инкрементально при показе и оценке вопросов"""
+    __tablename__ = 'session_stats'
+
+    session_id = Column(Integer, ForeignKey('study_sessions.id'), primary_key=True)
+    total_questions = Column(Integer, default=0, nullable=False)
+    easy_questions = Column(Integer, default=0, nullable=False)
+    medium_questions = Column(Integer, default=0, nullable=False)
+    hard_questions = Column(Integer, default=0, nullable=False)
+    pending_questions = Column(Integer, default=0, nullable=False)
+    total_shows = Column(Integer, default=0, nullable=False)
+
+    session = relationship("StudySession", back_populates="stats")
+
+
+class QuestionReview(Base):
+    """Состояние интервального повторения вопроса (SM-2), общее для всех сессий"""
+    __tablename__ = 'question_reviews'
+
+    question_id = Column(Integer, ForeignKey('questions.id'), primary_key=True)
+    ease = Column(Float, default=2.5, nullable=False)
+    interval = Column(Float, default=0, nullable=False)  # дни
+    repetitions = Column(Integer, default=0, nullable=False)  # успешных повторений подряд
+    lapses = Column(Integer, default=0, nullable=False)
+    next_due = Column(DateTime(timezone=True), nullable=False, index=True)
+    last_reviewed = Column(DateTime(timezone=True), nullable=True)
+
+    question = relationship("Question", back_populates="review")
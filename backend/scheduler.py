@@ -0,0 +1,104 @@
+"""Интервальное повторение вопросов по алгоритму SM-2.
+
+Оценка в сессии (easy/medium/hard) переводится в качество ответа SM-2.
+Состояние хранится в question_reviews и общее для всех сессий: новая
+сессия продолжает с того места, где остановилась предыдущая. Забытый
+вопрос (hard) возвращается через RELEARN_DELAY, ещё в той же сессии.
+"""
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+from models import QuestionReview
+
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+# Качество ответа по шкале SM-2 (0-5); меньше 3 - вопрос забыт
+RATING_QUALITY = {"hard": 2, "medium": 4, "easy": 5}
+RELEARN_DELAY = timedelta(minutes=float(os.getenv("RELEARN_DELAY_MINUTES", 10)))
+
+
+def schedule(review, rating: str, now: datetime):
+    """Обновить состояние повторения (словарь в форме review_to_dict) после оценки"""
+    quality = RATING_QUALITY[rating]
+    if quality < 3:
+        review["repetitions"] = 0
+        review["lapses"] += 1
+        review["interval"] = 0
+        review["next_due"] = now + RELEARN_DELAY
+    else:
+        review["repetitions"] += 1
+        if review["repetitions"] == 1:
+            review["interval"] = 1
+        elif review["repetitions"] == 2:
+            review["interval"] = 6
+        else:
+            review["interval"] = review["interval"] * review["ease"]
+        review["next_due"] = now + timedelta(days=review["interval"])
+    review["ease"] = max(MIN_EASE, review["ease"] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    review["last_reviewed"] = now
+
+
+def review_questions(db: Session, ratings, now=None):
+    """Учесть пачку оценок [(question_id, rating), ...] в текущей транзакции.
+
+    Существующие состояния читаются одним запросом, оценки применяются по
+    порядку в памяти. Затем один INSERT новых состояний и один UPDATE по
+    первичному ключу для остальных: все поля пишутся в каждой строке, поэтому
+    разные оценки не дробят UPDATE на построчные. Оценки вне расписания
+    (например, pending) пропускаются. Возвращает {question_id: состояние}
+    в форме review_to_dict.
+    """
+    now = now or datetime.now()
+    ratings = [(question_id, rating) for question_id, rating in ratings if rating in RATING_QUALITY]
+    if not ratings:
+        return {}
+    question_ids = list(dict.fromkeys(question_id for question_id, _ in ratings))
+    reviews = {
+        review["question_id"]: dict(review)
+        for review in db.execute(
+            select(QuestionReview.__table__).where(QuestionReview.question_id.in_(question_ids))
+        ).mappings()
+    }
+    new_ids = set()
+    for question_id, rating in ratings:
+        review = reviews.get(question_id)
+        if review is None:
+            review = {"question_id": question_id, "ease": INITIAL_EASE, "interval": 0, "repetitions": 0,
+                      "lapses": 0, "next_due": None, "last_reviewed": None}
+            reviews[question_id] = review
+            new_ids.add(question_id)
+        schedule(review, rating, now)
+
+    new_rows = [reviews[question_id] for question_id in question_ids if question_id in new_ids]
+    changed_rows = [reviews[question_id] for question_id in question_ids if question_id not in new_ids]
+    if new_rows:
+        db.execute(insert(QuestionReview), new_rows)
+    if changed_rows:
+        # ORM bulk UPDATE по первичному ключу: один executemany
+        db.execute(update(QuestionReview), changed_rows)
+    return {question_id: reviews[question_id] for question_id in question_ids}
+
+
+def review_question(db: Session, question_id: int, rating: str, now=None):
+    """Учесть одну оценку; состояние или None, если оценка не участвует в расписании"""
+    return review_questions(db, [(question_id, rating)], now).get(question_id)
+
+
+def review_to_dict(review: QuestionReview):
+    return {
+        "question_id": review.question_id,
+        "ease": review.ease,
+        "interval": review.interval,
+        "repetitions": review.repetitions,
+        "lapses": review.lapses,
+        "next_due": review.next_due,
+        "last_reviewed": review.last_reviewed,
+    }
+
+
+def due_reviews(db: Session, now=None, limit=50):
+    """Повторения со сроком до now, самые просроченные первыми (диапазон по индексу next_due)"""
+    return db.query(QuestionReview).filter(
+        QuestionReview.next_due <= (now or datetime.now())
+    ).order_by(QuestionReview.next_due).limit(limit).all()
@@ -0,0 +1,116 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Слова запроса: буквы/цифры любого алфавита (в том числе кириллица)
+TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Вес колонок для bm25: совпадение в вопросе важнее совпадения в ответе
+Q_WEIGHT = 2.0
+A_WEIGHT = 1.0
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+SNIPPET_ELLIPSIS = "…"
+SNIPPET_TOKENS = 16
+
+# Документ для поиска на PostgreSQL; по этому же выражению построен
+# GIN-индекс ix_questions_search (миграция add_questions_fts)
+POSTGRES_DOCUMENT = "setweight(to_tsvector('simple', q), 'A') || setweight(to_tsvector('simple', a), 'B')"
+POSTGRES_HEADLINE = (
+    f'StartSel="{SNIPPET_START}", StopSel="{SNIPPET_END}", FragmentDelimiter="{SNIPPET_ELLIPSIS}", '
+    f"MaxWords={SNIPPET_TOKENS}, MinWords={SNIPPET_TOKENS // 2}, MaxFragments=1"
+)
+
+
+def build_match_query(query):
+    """Преобразовать пользовательскую строку в безопасное выражение MATCH.
+
+    Каждое слово берётся в кавычки (операторы FTS5 в тексте не срабатывают)
+    и ищется по префиксу, слова объединяются через AND.
+    """
+    terms = TERM_PATTERN.findall(query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def build_tsquery(query):
+    """Та же семантика для to_tsquery: слова по префиксу, через AND"""
+    terms = TERM_PATTERN.findall(query)
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def search_questions(db: Session, query: str, limit: int = 20, offset: int = 0):
+    """Ранжированный поиск по вопросам и ответам через questions_fts.
+
+    Возвращает список словарей: id, rank и сниппеты для q и a. Меньший
+    rank - лучшее совпадение. На PostgreSQL - см. search_questions_postgres.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return search_questions_postgres(db, query, limit, offset)
+
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    rows = db.execute(
+        text(f"""
+            SELECT rowid AS id,
+                   bm25(questions_fts, :q_weight, :a_weight) AS rank,
+                   snippet(questions_fts, 0, :start, :end, :ellipsis, {SNIPPET_TOKENS}) AS q_snippet,
+                   snippet(questions_fts, 1, :start, :end, :ellipsis, {SNIPPET_TOKENS}) AS a_snippet
+            FROM questions_fts
+            WHERE questions_fts MATCH :match
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """),
+        {
+            "q_weight": Q_WEIGHT,
+            "a_weight": A_WEIGHT,
+            "start": SNIPPET_START,
+            "end": SNIPPET_END,
+            "ellipsis": SNIPPET_ELLIPSIS,
+            "match": match,
+            "limit": limit,
+            "offset": offset,
+        },
+    ).fetchall()
+    return [dict(row._mapping) for row in rows]
+
+
+def search_questions_postgres(db: Session, query: str, limit: int = 20, offset: int = 0):
+    """Поиск через tsvector и GIN-индекс, в том же формате, что и FTS5.
+
+    rank - ts_rank со знаком минус (как у bm25, меньше - лучше), веса
+    вопроса и ответа те же. Сниппеты строятся только для страницы
+    результатов: ts_headline перечитывает текст целиком.
+    """
+    tsquery = build_tsquery(query)
+    if not tsquery:
+        return []
+
+    rows = db.execute(
+        text(f"""
+            SELECT page.id, page.rank,
+                   ts_headline('simple', questions.q, page.query, :options) AS q_snippet,
+                   ts_headline('simple', questions.a, page.query, :options) AS a_snippet
+            FROM (
+                SELECT questions.id, query,
+                       -ts_rank(ARRAY[0, 0, :a_weight, :q_weight]::float4[], {POSTGRES_DOCUMENT}, query) AS rank
+                FROM questions, to_tsquery('simple', :tsquery) AS query
+                WHERE {POSTGRES_DOCUMENT} @@ query
+                ORDER BY rank
+                LIMIT :limit OFFSET :offset
+            ) AS page
+            JOIN questions ON questions.id = page.id
+            ORDER BY page.rank
+        """),
+        {
+            "q_weight": 1.0,
+            "a_weight": A_WEIGHT / Q_WEIGHT,
+            "options": POSTGRES_HEADLINE,
+            "tsquery": tsquery,
+            "limit": limit,
+            "offset": offset,
+        },
+    ).fetchall()
+    return [dict(row._mapping) for row in rows]
@@ -0,0 +1,162 @@
+"""Быстрый путь сериализации для списочных эндпоинтов.
+
+Списки собираются из Core select(): строки сразу становятся dict без
+ORM-объектов и отдаются через ORJSONResponse. Обработчик возвращает
+готовый Response, поэтому FastAPI не прогоняет строки через
+response_model и jsonable_encoder. response_model у эндпоинтов остаётся
+и описывает ответ в OpenAPI - проекции ниже должны ему соответствовать.
+"""
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import Session
+from models import Act, Question, StudySession, Tag, TestItem, Time, question_tags
+
+
+def json_response(content, etag=None):
+    return ORJSONResponse(content, headers={"ETag": etag} if etag else None)
+
+
+def rows(db: Session, statement):
+    return [dict(row) for row in db.execute(statement).mappings()]
+
+
+def select_acts(db: Session):
+    return rows(db, select(Act.__table__))
+
+
+def select_test_items(db: Session):
+    return rows(db, select(TestItem.__table__))
+
+
+def select_study_sessions(db: Session, session_id=None):
+    statement = select(StudySession.__table__)
+    if session_id is not None:
+        statement = statement.where(StudySession.id == session_id)
+    return rows(db, statement)
+
+
+def select_time(db: Session, day, act_id: int):
+    """Строка times за день занятия в форме TimeResponse"""
+    return rows(db, select(Time.day, Time.act_id, Time.time, Time.count).where(
+        Time.day == day, Time.act_id == act_id
+    ))[0]
+
+
+def select_tags(db: Session):
+    return rows(db, select(Tag.slug, Tag.title))
+
+
+def tags_by_question(db: Session, question_ids):
+    """Тэги вопросов одним запросом: question_id -> [{"slug", "title"}]"""
+    result = {question_id: [] for question_id in question_ids}
+    if not result:
+        return result
+    statement = (
+        select(question_tags.c.question_id, Tag.slug, Tag.title)
+        .join(Tag, Tag.slug == question_tags.c.tag_slug)
+        .where(question_tags.c.question_id.in_(list(result)))
+    )
+    for question_id, slug, title in db.execute(statement):
+        result[question_id].append({"slug": slug, "title": title})
+    return result
+
+
+def attach_tags(db: Session, questions):
+    tags = tags_by_question(db, [question["id"] for question in questions])
+    for question in questions:
+        question["tags"] = tags[question["id"]]
+    return questions
+
+
+# Поля вопроса для ?fields= в каноническом порядке; id отдаётся всегда
+QUESTION_FIELDS = ("id", "q", "a", "difficulty", "tags")
+
+
+def question_columns(fields):
+    return [getattr(Question, field) for field in fields if field != "tags"]
+
+
+def select_questions_by_id(db: Session, question_ids):
+    """Вопросы с тэгами по списку id: {id: вопрос в форме QuestionResponse}"""
+    questions = rows(db, select(Question.id, Question.q, Question.a, Question.difficulty).where(
+        Question.id.in_(list(question_ids))
+    ))
+    return {question["id"]: question for question in attach_tags(db, questions)}
+
+
+def has_any_tag(slugs):
+    return exists().where(
+        question_tags.c.question_id == Question.id,
+        question_tags.c.tag_slug.in_(slugs)
+    )
+
+
+def select_questions(db: Session, after_id=None, limit=None, tag=(), exclude_tag=(), difficulty=None,
+                     fields=QUESTION_FIELDS):
+    """Страница вопросов (keyset по id) в форме QuestionResponse.
+
+    fields - проекция из QUESTION_FIELDS: невыбранные столбцы (прежде
+    всего длинный ответ a) не читаются, тэги без "tags" не загружаются.
+    """
+    statement = select(*question_columns(fields))
+    if after_id is not None:
+        statement = statement.where(Question.id > after_id)
+    if difficulty:
+        statement = statement.where(Question.difficulty == difficulty)
+    if tag:
+        statement = statement.where(has_any_tag(tag))
+    if exclude_tag:
+        statement = statement.where(~has_any_tag(exclude_tag))
+    statement = statement.order_by(Question.id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    questions = rows(db, statement)
+    return attach_tags(db, questions) if "tags" in fields else questions
+
+
+def select_question_answer(db: Session, question_id: int):
+    """Только ответ на вопрос: {"id", "a"} или None"""
+    answer = db.execute(select(Question.id, Question.a).where(Question.id == question_id)).mappings().first()
+    return dict(answer) if answer is not None else None
+
+
+def join_search_hits(db: Session, hits):
+    """Дополнить результаты поиска текстом вопроса и тэгами (форма QuestionSearchResult)"""
+    ids = [hit["id"] for hit in hits]
+    questions = {
+        question["id"]: question
+        for question in rows(db, select(Question.id, Question.q, Question.difficulty).where(Question.id.in_(ids)))
+    }
+    tags = tags_by_question(db, questions)
+    return [
+        {**questions[hit["id"]], **hit, "tags": tags[hit["id"]]}
+        for hit in hits if hit["id"] in questions
+    ]
+
+
+def question_facets(db: Session, tag=(), difficulty=None):
+    """Число вопросов по тэгам и по сложности.
+
+    Счётчики тэгов сужаются выбранной сложностью, счётчики сложности -
+    выбранными тэгами (как фильтр tag в списке: любой из них). Тэги без
+    вопросов тоже попадают в ответ, с нулём.
+    """
+    tag_counts = (
+        select(Tag.slug, Tag.title, func.count(Question.id).label("count"))
+        .select_from(Tag)
+        .outerjoin(question_tags, question_tags.c.tag_slug == Tag.slug)
+    )
+    if difficulty:
+        tag_counts = tag_counts.outerjoin(
+            Question, (Question.id == question_tags.c.question_id) & (Question.difficulty == difficulty)
+        )
+    else:
+        tag_counts = tag_counts.outerjoin(Question, Question.id == question_tags.c.question_id)
+    tag_counts = tag_counts.group_by(Tag.slug, Tag.title).order_by(Tag.slug)
+
+    difficulty_counts = select(Question.difficulty, func.count().label("count"))
+    if tag:
+        difficulty_counts = difficulty_counts.where(has_any_tag(tag))
+    difficulty_counts = difficulty_counts.group_by(Question.difficulty).order_by(Question.difficulty)
+
+    return {"tags": rows(db, tag_counts), "difficulties": rows(db, difficulty_counts)}
@@ -0,0 +1,250 @@
+import random
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import exists, func, insert, select
+from sqlalchemy.orm import Session
+from models import Question, QuestionReview, SessionQuestion, SessionStats
+
+# Статусы, для которых ведутся отдельные счётчики
+STATUS_COUNTERS = {
+    'easy': 'easy_questions',
+    'medium': 'medium_questions',
+    'hard': 'hard_questions',
+    'pending': 'pending_questions',
+}
+
+
+def easy_question_ids(db: Session, session_id: int):
+    """Подзапрос с id вопросов, отмеченных в сессии как лёгкие"""
+    return db.query(SessionQuestion.question_id).filter(
+        SessionQuestion.session_id == session_id,
+        SessionQuestion.status == 'easy'
+    )
+
+
+def pick_question_id(db: Session, session_id: int, exclude_ids=(), now=None):
+    """Выбрать следующий вопрос для сессии (см. pick_question_ids)"""
+    question_ids = pick_question_ids(db, session_id, 1, exclude_ids, now)
+    return question_ids[0] if question_ids else None
+
+
+def pick_question_ids(db: Session, session_id: int, n: int, exclude_ids=(), now=None):
+    """Выбрать до n разных вопросов для сессии по расписанию повторений.
+
+    Сначала просроченные повторения, самые давние первыми (диапазон по
+    индексу next_due). Затем случайные вопросы, которые ещё ни разу не
+    оценивались. Если не хватает и их, добираем повторения с ближайшим
+    сроком. Вопросы, отмеченные в сессии как лёгкие, и exclude_ids
+    пропускаются. Число запросов не зависит от n.
+    """
+    picked = []
+
+    def reviews():
+        query = db.query(QuestionReview.question_id).filter(
+            ~QuestionReview.question_id.in_(easy_question_ids(db, session_id))
+        )
+        excluded = list(exclude_ids) + picked
+        if excluded:
+            query = query.filter(~QuestionReview.question_id.in_(excluded))
+        return query
+
+    picked += [question_id for (question_id,) in reviews().filter(
+        QuestionReview.next_due <= (now or datetime.now())
+    ).order_by(QuestionReview.next_due).limit(n)]
+
+    if len(picked) < n:
+        picked += random_question_ids(db, session_id, n - len(picked), list(exclude_ids) + picked, unreviewed=True)
+    if len(picked) < n:
+        picked += [question_id for (question_id,) in reviews().order_by(QuestionReview.next_due).limit(n - len(picked))]
+    return picked
+
+
+def random_question_ids(db: Session, session_id: int, n: int, exclude_ids=(), unreviewed=False):
+    """До n доступных вопросов со случайного места каталога, не загружая его.
+
+    Берём случайную точку в диапазоне id и читаем n подходящих id справа
+    от неё (с переходом в начало диапазона), используя индекс по
+    первичному ключу. Читаются только id, строки вопросов не загружаются.
+    Пропуски в нумерации дают небольшой перекос вероятностей, для
+    учебной выборки это допустимо.
+    """
+    # min и max отдельными подзапросами: вместе в одном SELECT SQLite
+    # не может взять их из индекса и просматривает всю таблицу
+    min_id, max_id = db.query(
+        select(func.min(Question.id)).scalar_subquery(),
+        select(func.max(Question.id)).scalar_subquery()
+    ).one()
+    if min_id is None:
+        return []
+
+    candidates = db.query(Question.id).filter(
+        ~Question.id.in_(easy_question_ids(db, session_id))
+    )
+    if exclude_ids:
+        candidates = candidates.filter(~Question.id.in_(list(exclude_ids)))
+    if unreviewed:
+        candidates = candidates.filter(~exists().where(QuestionReview.question_id == Question.id))
+
+    pivot = random.randint(min_id, max_id)
+    question_ids = [question_id for (question_id,) in
+                    candidates.filter(Question.id >= pivot).order_by(Question.id).limit(n)]
+    if len(question_ids) < n:
+        question_ids += [question_id for (question_id,) in
+                         candidates.filter(Question.id < pivot).order_by(Question.id).limit(n - len(question_ids))]
+    return question_ids
+
+
+def compute_session_stats(db: Session, session_id: int):
+    """Посчитать статистику сессии одним запросом с GROUP BY status"""
+    rows = db.query(
+        SessionQuestion.status,
+        func.count(SessionQuestion.id),
+        func.coalesce(func.sum(SessionQuestion.times_shown), 0)
+    ).filter(
+        SessionQuestion.session_id == session_id
+    ).group_by(SessionQuestion.status).all()
+
+    stats = {counter: 0 for counter in STATUS_COUNTERS.values()}
+    stats["total_questions"] = 0
+    stats["total_shows"] = 0
+    for status, count, shows in rows:
+        if status in STATUS_COUNTERS:
+            stats[STATUS_COUNTERS[status]] = count
+        stats["total_questions"] += count
+        stats["total_shows"] += shows
+    return stats
+
+
+def get_session_stats(db: Session, session_id: int):
+    """Статистика сессии из строки счётчиков.
+
+    Если строки ещё нет (сессия создана до появления счётчиков),
+    она заполняется через create_session_stats в текущей транзакции -
+    коммит за вызывающей стороной.
+    """
+    row = db.query(SessionStats).filter(SessionStats.session_id == session_id).first()
+    if row is None:
+        row = create_session_stats(db, session_id)
+    return stats_to_dict(row)
+
+
+def create_session_stats(db: Session, session_id: int):
+    """Заполнить строку счётчиков по session_questions.
+
+    Сначала сбрасываем сессию на диск: иначе (autoflush выключен)
+    пересчёт не увидит уже сделанные, но не записанные изменения.
+    """
+    db.flush()
+    row = SessionStats(session_id=session_id, **compute_session_stats(db, session_id))
+    db.add(row)
+    db.flush()
+    return row
+
+
+def read_session_stats(db: Session, session_id: int):
+    """Статистика сессии без записи - для читающих воркеров.
+
+    Строка счётчиков не создаётся: если её нет, статистика считается
+    через compute_session_stats, а заполнит строку первая запись в сессию.
+    """
+    row = db.query(SessionStats).filter(SessionStats.session_id == session_id).first()
+    if row is None:
+        return compute_session_stats(db, session_id)
+    return stats_to_dict(row)
+
+
+def stats_to_dict(row: SessionStats):
+    return {
+        "total_questions": row.total_questions,
+        "easy_questions": row.easy_questions,
+        "medium_questions": row.medium_questions,
+        "hard_questions": row.hard_questions,
+        "pending_questions": row.pending_questions,
+        "total_shows": row.total_shows,
+    }
+
+
+def bump_session_stats(db: Session, session_id: int, shows=0, new_questions=0, old_status=None, new_status=None):
+    """Инкрементально обновить счётчики сессии в текущей транзакции.
+
+    Вызывается после изменения вопросов сессии (см. apply_stats_deltas).
+    """
+    deltas = {"total_shows": shows, "total_questions": new_questions}
+    add_status_change(deltas, old_status, new_status)
+    apply_stats_deltas(db, session_id, deltas)
+
+
+def add_status_change(deltas, old_status, new_status):
+    """Учесть смену статуса вопроса в словаре изменений счётчиков"""
+    if old_status == new_status:
+        return
+    if old_status in STATUS_COUNTERS:
+        deltas[STATUS_COUNTERS[old_status]] = deltas.get(STATUS_COUNTERS[old_status], 0) - 1
+    if new_status in STATUS_COUNTERS:
+        deltas[STATUS_COUNTERS[new_status]] = deltas.get(STATUS_COUNTERS[new_status], 0) + 1
+
+
+def apply_stats_deltas(db: Session, session_id: int, deltas):
+    """Один UPDATE счётчиков сессии: {"total_shows": 3, "easy_questions": -1, ...}
+
+    deltas описывают изменения, уже сделанные в текущей транзакции. Если
+    строки счётчиков нет, UPDATE ничего не меняет, и строка создаётся
+    пересчётом (create_session_stats), который эти изменения уже учитывает.
+    """
+    values = {
+        getattr(SessionStats, counter): getattr(SessionStats, counter) + delta
+        for counter, delta in deltas.items() if delta
+    }
+    if not values:
+        return
+    updated = db.query(SessionStats).filter(SessionStats.session_id == session_id).update(
+        values, synchronize_session=False
+    )
+    if updated == 0:
+        create_session_stats(db, session_id)
+
+
+def register_shows(db: Session, session_id: int, question_ids, now=None):
+    """Отметить вопросы показанными в сессии в текущей транзакции.
+
+    Для уже встречавшихся вопросов растёт times_shown, для новых
+    создаются строки со статусом pending. Вопрос может повторяться в
+    question_ids - каждое вхождение считается показом. Счётчики сессии
+    обновляются одним UPDATE. Возвращает {question_id: SessionQuestion}.
+    """
+    now = now or datetime.now()
+    counts = Counter(question_ids)
+    session_questions = {
+        session_question.question_id: session_question
+        for session_question in db.query(SessionQuestion).filter(
+            SessionQuestion.session_id == session_id,
+            SessionQuestion.question_id.in_(list(counts))
+        )
+    }
+    for session_question in session_questions.values():
+        session_question.times_shown += counts[session_question.question_id]
+        session_question.last_shown = now
+
+    # Новые строки одним INSERT без RETURNING: через ORM с серверным
+    # created_at SQLite вставлял бы их по одной. id читаем следующим запросом.
+    new_ids = [question_id for question_id in counts if question_id not in session_questions]
+    if new_ids:
+        db.execute(insert(SessionQuestion), [
+            {"session_id": session_id, "question_id": question_id,
+             "times_shown": counts[question_id], "last_shown": now, "status": 'pending'}
+            for question_id in new_ids
+        ])
+        session_questions.update(
+            (session_question.question_id, session_question)
+            for session_question in db.query(SessionQuestion).filter(
+                SessionQuestion.session_id == session_id,
+                SessionQuestion.question_id.in_(new_ids)
+            )
+        )
+    new_questions = len(new_ids)
+    apply_stats_deltas(db, session_id, {
+        "total_shows": len(question_ids),
+        "total_questions": new_questions,
+        "pending_questions": new_questions,
+    })
+    return session_questions
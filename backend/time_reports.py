@@ -0,0 +1,88 @@
+from datetime import timedelta
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from database import dialect_insert
+from models import ActClosure, Time, TimeWeekly, TimeMonthly
+
+# Период отчёта -> (таблица, колонка начала периода)
+PERIODS = {
+    "day": (Time, Time.day),
+    "week": (TimeWeekly, TimeWeekly.week_start),
+    "month": (TimeMonthly, TimeMonthly.month_start),
+}
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def _add_to_row(db: Session, model, keys, time, count):
+    """INSERT ... ON CONFLICT DO UPDATE: прибавить time/count к строке сводки"""
+    stmt = dialect_insert(db)(model).values(**keys, time=time, count=count)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            "time": func.coalesce(model.time, 0) + stmt.excluded.time,
+            "count": func.coalesce(model.count, 0) + stmt.excluded.count,
+        }
+    )
+    db.execute(stmt)
+
+
+def record_time(db: Session, day, act_id: int, time: int = 0, count: float = 0):
+    """Прибавить время и количество к дню занятия.
+
+    Вместе со строкой times в той же транзакции обновляются недельная и
+    месячная сводки, так что отчёты не пересчитывают дневные строки.
+    Все записи в times должны идти через эту функцию (или set_time).
+    """
+    _add_to_row(db, Time, {"day": day, "act_id": act_id}, time, count)
+    _add_to_row(db, TimeWeekly, {"week_start": week_start(day), "act_id": act_id}, time, count)
+    _add_to_row(db, TimeMonthly, {"month_start": month_start(day), "act_id": act_id}, time, count)
+
+
+def set_time(db: Session, day, act_id: int, time: int, count: float):
+    """Установить абсолютные значения дня, сводки получают разницу"""
+    current = db.query(Time.time, Time.count).filter(Time.day == day, Time.act_id == act_id).first()
+    old_time, old_count = (current.time or 0, current.count or 0) if current else (0, 0)
+    record_time(db, day, act_id, time - old_time, count - old_count)
+
+
+def time_report(db: Session, start, end, period="day", act_id=None, rollup=True):
+    """Суммы времени по периодам и занятиям за [start, end].
+
+    Для week/month start приводится к началу недели/месяца, данные берутся
+    из сводных таблиц. При rollup=True сумма занятия включает всех его
+    потомков (соединение с таблицей замыкания act_closure). act_id
+    ограничивает отчёт одним занятием (с потомками при rollup).
+    """
+    model, bucket = PERIODS[period]
+    if period == "week":
+        start = week_start(start)
+    elif period == "month":
+        start = month_start(start)
+
+    if rollup:
+        # Сумма занятия включает всех потомков: соединяем строки с таблицей замыкания
+        group_act = ActClosure.ancestor_id
+        query = select(bucket, group_act, func.sum(model.time), func.sum(model.count)).join(
+            ActClosure, ActClosure.descendant_id == model.act_id
+        )
+        if act_id is not None:
+            query = query.where(ActClosure.ancestor_id == act_id)
+    else:
+        group_act = model.act_id
+        query = select(bucket, group_act, func.sum(model.time), func.sum(model.count))
+        if act_id is not None:
+            query = query.where(model.act_id == act_id)
+
+    query = query.where(bucket >= start, bucket <= end).group_by(bucket, group_act).order_by(bucket, group_act)
+
+    return [
+        {"period_start": period_start, "act_id": row_act_id, "time": time or 0, "count": count or 0}
+        for period_start, row_act_id, time, count in db.execute(query)
+    ]
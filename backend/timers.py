@@ -0,0 +1,206 @@
+import os
+import threading
+import time as time_module
+from datetime import datetime, timedelta, time as dt_time
+from database import SessionLocal
+from models import Timer, TimerState
+from time_reports import record_time
+
+# Как часто накопленные секунды сбрасываются в times (секунды)
+TIMER_FLUSH_INTERVAL = float(os.getenv("TIMER_FLUSH_INTERVAL", 60))
+
+
+def split_by_day(start, seconds):
+    """Разбить отрезок [start, start + seconds] по календарным дням"""
+    parts = {}
+    while seconds > 0:
+        next_midnight = datetime.combine(start.date() + timedelta(days=1), dt_time.min, tzinfo=start.tzinfo)
+        chunk = min(seconds, (next_midnight - start).total_seconds())
+        parts[start.date()] = parts.get(start.date(), 0) + chunk
+        start = next_midnight
+        seconds -= chunk
+    return parts
+
+
+class RunningTimer:
+    """Состояние таймера в памяти процесса"""
+
+    def __init__(self, timer_id, act_id, state, flushed):
+        self.id = timer_id
+        self.act_id = act_id
+        self.state = state
+        self.flushed = flushed  # секунды, уже записанные в times
+        self.pending = {}  # день -> ещё не записанные секунды
+        self.segment_mono = None  # начало текущего отрезка счёта (monotonic)
+        self.segment_wall = None  # то же по настенным часам, для разбиения по дням
+
+
+class TimerService:
+    """Таймеры занятий: отсчёт по монотонным часам, запись в times пачками.
+
+    Пока таймер считает, в БД ничего не пишется. Накопленные секунды
+    раскладываются по дням (отрезок через полночь делится между днями)
+    и записываются в строки times через record_time при flush: по
+    расписанию из lifespan и при остановке таймера.
+    """
+
+    def __init__(self, clock=time_module.monotonic, now=datetime.now):
+        self.clock = clock
+        self.now = now
+        self.timers = {}
+        self.lock = threading.RLock()
+
+    def _checkpoint(self, timer):
+        """Перенести время текущего отрезка в pending и начать новый отрезок"""
+        if timer.state != TimerState.COUNTING:
+            return
+        now_mono = self.clock()
+        elapsed = now_mono - timer.segment_mono
+        for day, seconds in split_by_day(timer.segment_wall, elapsed).items():
+            timer.pending[day] = timer.pending.get(day, 0) + seconds
+        timer.segment_mono = now_mono
+        timer.segment_wall = timer.segment_wall + timedelta(seconds=elapsed)
+
+    def _begin_segment(self, timer):
+        timer.state = TimerState.COUNTING
+        timer.segment_mono = self.clock()
+        timer.segment_wall = self.now()
+
+    def _get(self, timer_id):
+        timer = self.timers.get(timer_id)
+        if timer is None:
+            raise LookupError(timer_id)
+        return timer
+
+    def _set_state(self, db, timer_id, state):
+        db.query(Timer).filter(Timer.id == timer_id).update({Timer.state: state}, synchronize_session=False)
+
+    def to_dict(self, timer):
+        elapsed = timer.flushed + sum(timer.pending.values())
+        if timer.state == TimerState.COUNTING:
+            elapsed += self.clock() - timer.segment_mono
+        return {
+            "id": timer.id,
+            "act_id": timer.act_id,
+            "state": timer.state.value,
+            "elapsed": int(elapsed),
+        }
+
+    def restore(self, db):
+        """Поднять незавершённые таймеры из БД после перезапуска.
+
+        Время, пока процесс не работал, не засчитывается: считающие
+        таймеры продолжают отсчёт с момента восстановления.
+        """
+        with self.lock:
+            for row in db.query(Timer).filter(Timer.state != TimerState.STOPPED).all():
+                timer = RunningTimer(row.id, row.act_id, row.state, row.time or 0)
+                if row.state == TimerState.COUNTING:
+                    self._begin_segment(timer)
+                self.timers[row.id] = timer
+
+    def list(self):
+        with self.lock:
+            return [self.to_dict(timer) for timer in self.timers.values()]
+
+    def get(self, timer_id):
+        with self.lock:
+            return self.to_dict(self._get(timer_id))
+
+    def start(self, db, act_id):
+        with self.lock:
+            row = Timer(act_id=act_id, time=0, state=TimerState.COUNTING)
+            db.add(row)
+            db.commit()
+            timer = RunningTimer(row.id, act_id, TimerState.COUNTING, 0)
+            self._begin_segment(timer)
+            self.timers[row.id] = timer
+            return self.to_dict(timer)
+
+    def pause(self, db, timer_id):
+        with self.lock:
+            timer = self._get(timer_id)
+            if timer.state != TimerState.COUNTING:
+                raise ValueError("Timer is not counting")
+            self._checkpoint(timer)
+            timer.state = TimerState.PAUSED
+            self._set_state(db, timer_id, TimerState.PAUSED)
+            db.commit()
+            return self.to_dict(timer)
+
+    def resume(self, db, timer_id):
+        with self.lock:
+            timer = self._get(timer_id)
+            if timer.state != TimerState.PAUSED:
+                raise ValueError("Timer is not paused")
+            self._begin_segment(timer)
+            self._set_state(db, timer_id, TimerState.COUNTING)
+            db.commit()
+            return self.to_dict(timer)
+
+    def stop(self, db, timer_id):
+        """Остановить таймер и сразу записать его время (с дробным остатком)"""
+        with self.lock:
+            timer = self._get(timer_id)
+            self._checkpoint(timer)
+            timer.state = TimerState.STOPPED
+            self._write(db, [timer], final=True)
+            self._set_state(db, timer_id, TimerState.STOPPED)
+            db.commit()
+            del self.timers[timer_id]
+            return self.to_dict(timer)
+
+    def _write(self, db, timers, final=False):
+        """Записать pending таймеров в times, сгруппировав по (день, занятие).
+
+        В times пишутся целые секунды, дробный остаток остаётся в pending
+        до следующего сброса (при остановке округляется).
+        """
+        totals = {}
+        for timer in timers:
+            written = 0
+            for day, seconds in list(timer.pending.items()):
+                whole = round(seconds) if final else int(seconds)
+                if whole:
+                    key = (day, timer.act_id)
+                    totals[key] = totals.get(key, 0) + whole
+                    written += whole
+                remainder = seconds - whole
+                if final or not remainder:
+                    del timer.pending[day]
+                else:
+                    timer.pending[day] = remainder
+            if written:
+                timer.flushed += written
+                db.query(Timer).filter(Timer.id == timer.id).update(
+                    {Timer.time: Timer.time + written}, synchronize_session=False
+                )
+        for (day, act_id), seconds in totals.items():
+            record_time(db, day, act_id, seconds)
+
+    def flush(self):
+        """Сбросить накопленное время всех таймеров одной транзакцией"""
+        with self.lock:
+            timers = list(self.timers.values())
+            if not timers:
+                return
+            snapshot = {}
+            for timer in timers:
+                self._checkpoint(timer)
+                snapshot[timer.id] = (dict(timer.pending), timer.flushed)
+
+            db = SessionLocal()
+            try:
+                self._write(db, timers)
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Возвращаем несохранённое время, попробуем в следующий раз
+                for timer in timers:
+                    timer.pending, timer.flushed = snapshot[timer.id]
+                raise
+            finally:
+                db.close()
+
+
+timer_service = TimerService()
@@ -0,0 +1,76 @@
+from fastapi import Request, Response
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from models import TableVersion
+
+# Таблицы, для которых ведутся счётчики версий (строки создаёт миграция)
+VERSIONED_TABLES = {"acts", "act_closure", "questions", "question_tags", "tags"}
+
+# Какие таблицы определяют ответ GET-эндпоинта
+TAGS_TABLES = ("tags",)
+QUESTIONS_TABLES = ("questions", "question_tags", "tags")
+ACTS_TABLES = ("acts", "act_closure")
+
+
+def _mark_changed(session, table_name):
+    if table_name in VERSIONED_TABLES:
+        session.info.setdefault("changed_tables", set()).add(table_name)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_flushed_tables(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            _mark_changed(session, table.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def collect_statement_tables(orm_execute_state):
+    """INSERT/UPDATE/DELETE, выполненные через session.execute и query.update/delete"""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name != TableVersion.__tablename__:
+            _mark_changed(orm_execute_state.session, table.name)
+
+
+@event.listens_for(Session, "before_commit")
+def bump_versions(session):
+    """Увеличить версии изменённых таблиц в той же транзакции, что и сами изменения"""
+    session.flush()  # before_commit вызывается до финального flush
+    changed = session.info.pop("changed_tables", None)
+    for table_name in sorted(changed or ()):
+        session.execute(
+            update(TableVersion)
+            .where(TableVersion.table_name == table_name)
+            .values(version=TableVersion.version + 1)
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_changes(session):
+    session.info.pop("changed_tables", None)
+
+
+def table_etag(db: Session, tables):
+    """Слабый ETag из версий таблиц - один запрос к table_versions без ORM-объектов"""
+    versions = dict(db.execute(
+        select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(tables))
+    ).all())
+    return 'W/"' + "-".join(f"{name}.{versions.get(name, 0)}" for name in tables) + '"'
+
+
+def check_etag(request: Request, response: Response, db: Session, tables):
+    """Проставить ETag и вернуть (etag, ответ 304 или None).
+
+    Если клиент прислал тот же If-None-Match, обработчику остаётся
+    вернуть готовый 304.
+    """
+    etag = table_etag(db, tables)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {value.strip() for value in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            return etag, Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return etag, None
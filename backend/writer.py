@@ -0,0 +1,157 @@
+"""Единственный писатель: частые мелкие записи через очередь с group commit.
+
+SQLite допускает одну пишущую транзакцию на файл. Когда пишут сразу
+много потоков (или процессов), они по очереди ждут блокировку и на
+каждую запись тратят отдельный COMMIT. WriteQueue выполняет задания в
+одном потоке: забирает из очереди всё, что накопилось (до
+WRITE_BATCH_SIZE), выполняет каждое задание в своём SAVEPOINT и делает
+один COMMIT на пачку. Ошибка задания откатывает только его SAVEPOINT,
+остальные задания пачки сохраняются.
+
+pysqlite сам открывает транзакцию только перед DML, поэтому без внешней
+транзакции RELEASE первого SAVEPOINT сразу коммитит задание. На SQLite
+пачка открывается явным BEGIN IMMEDIATE: блокировка записи берётся в
+начале пачки, и все её задания попадают в один COMMIT.
+
+Задание - функция fn(db), которая пишет в сессию, но не делает commit.
+Исключение из fn (например, HTTPException) получает тот, кто ждёт
+результат. Задания одной пачки не видят объектов друг друга в identity
+map: после каждого задания сессия сбрасывается на диск и очищается.
+
+В многопроцессном режиме (см. docker-compose.workers.yml) очередь
+работает в единственном процессе-писателе, а читающие воркеры записей
+не получают.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from sqlalchemy import text
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Сколько заданий записи объединять в одну транзакцию
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 64))
+
+
+class WriteJob:
+    def __init__(self, fn):
+        self.fn = fn
+        # Контекст отправителя: SQL задания учитывается в метриках его HTTP-запроса
+        self.context = contextvars.copy_context()
+        self.future = Future()
+        self.result = None
+        self.error = None
+
+
+class WriteQueue:
+    def __init__(self, session_factory, batch_size=WRITE_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.committed = 0
+        self.failed = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """Дописать уже поставленные задания и остановить поток"""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.jobs.put(None)
+            thread.join()
+
+    def submit(self, fn):
+        """Поставить задание в очередь; результат - concurrent.futures.Future"""
+        if self.thread is None:
+            self.start()
+        job = WriteJob(fn)
+        self.jobs.put(job)
+        return job.future
+
+    async def run(self, fn):
+        """Выполнить задание и дождаться коммита его пачки, не занимая поток пула"""
+        return await asyncio.wrap_future(self.submit(fn))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "committed": self.committed,
+            "failed": self.failed,
+            "queued": self.jobs.qsize(),
+        }
+
+    def _take_batch(self):
+        """Дождаться первого задания и добрать уже ожидающие, без задержки"""
+        first = self.jobs.get()
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self.jobs.put(None)  # остановка после этой пачки
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.exception("Write batch failed")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+
+    def _write(self, batch):
+        db = self.session_factory()
+        try:
+            if db.get_bind().dialect.name == "sqlite":
+                db.execute(text("BEGIN IMMEDIATE"))
+            for job in batch:
+                try:
+                    with db.begin_nested():
+                        job.result = job.context.run(job.fn, db)
+                except Exception as e:
+                    job.error = e
+                db.expunge_all()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            for job in batch:
+                if job.error is None:
+                    job.error = e
+        finally:
+            db.close()
+
+        self.batches += 1
+        for job in batch:
+            if job.error is None:
+                self.committed += 1
+                job.future.set_result(job.result)
+            else:
+                self.failed += 1
+                job.future.set_exception(job.error)
+
+
+write_queue = WriteQueue(SessionLocal)